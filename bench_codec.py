@@ -0,0 +1,39 @@
+"""Benchmark: encode/decode cost and bytes on the wire, JSON versus the binary codec."""
+import argparse
+import time
+
+from codec import BINARY, JSON, decode_message, encode_message
+
+SAMPLES = {
+    'publish (64 B text)': {'type': 'publish', 'topic': 'sensors/eu/temperature', 'message': 'x' * 64},
+    'publish (1 KB text)': {'type': 'publish', 'topic': 'sensors/eu/temperature', 'message': 'x' * 1024},
+    'subscribe': {'type': 'subscribe', 'topic': 'sensors/eu/temperature'},
+    'query_topic': {'action': 'query_topic', 'topic': 'sensors/eu/temperature'},
+    'report_load': {'action': 'report_load', 'peer_id': 5001, 'load': 1250.5, 'subscribers': 42},
+}
+
+
+def time_per_call(function, argument, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(argument)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'message':<22} {'format':<7} {'bytes':>6} {'encode (us)':>12} {'decode (us)':>12}")
+    for name, message in SAMPLES.items():
+        for wire_format in (JSON, BINARY):
+            encoded = encode_message(message, wire_format)
+            assert decode_message(encoded) == message
+            encode_time = time_per_call(lambda m: encode_message(m, wire_format), message, args.iterations)
+            decode_time = time_per_call(decode_message, encoded, args.iterations)
+            print(f"{name:<22} {wire_format:<7} {len(encoded):>6} {encode_time * 1e6:>12.2f} {decode_time * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
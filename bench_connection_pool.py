@@ -0,0 +1,76 @@
+"""Benchmark: indexing-server ops/sec with pooled connections versus connect-per-call."""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from codec import recv_frame, send_frame
+from connection_pool import ConnectionPool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_server(port):
+    """Launch the asyncio indexing server as a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'indexing_server.py'), '--port', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Indexing server did not start on port {port}")
+
+
+def connect_per_call(address, message):
+    with socket.create_connection(address) as s:
+        send_frame(s, message)
+        return recv_frame(s.makefile('rb'))
+
+
+def run(call, threads, ops_per_thread):
+    """Run call() ops_per_thread times on each thread and return total ops/sec."""
+    def worker():
+        for _ in range(ops_per_thread):
+            call()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return threads * ops_per_thread / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=9050)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=2000, help='Operations per thread')
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    address = ('localhost', args.port)
+    message = {'action': 'query_topic', 'topic': 'benchmark'}
+    server = start_server(args.port)
+    try:
+        pool = ConnectionPool(address, args.pool_size)
+        baseline = run(lambda: connect_per_call(address, message), args.threads, args.ops)
+        pooled = run(lambda: pool.request(message), args.threads, args.ops)
+        pool.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"connect-per-call: {baseline:10.0f} ops/sec")
+    print(f"pooled ({args.pool_size} conns): {pooled:10.0f} ops/sec  ({pooled / baseline:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
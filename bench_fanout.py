@@ -0,0 +1,67 @@
+"""Benchmark: PeerNode fan-out throughput (messages/sec) for large subscriber counts."""
+import argparse
+import json
+import socket
+import time
+
+from fanout import FanoutEngine
+
+SUBSCRIBER_COUNTS = [1000, 10000]
+SINK_SOCKETS = 16  # Bound receivers the subscriber addresses cycle through
+
+
+def make_sinks(count):
+    sinks = []
+    for _ in range(count):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(('127.0.0.1', 0))
+        sinks.append(sink)
+    return sinks
+
+
+def legacy_fanout(sock, message, subscribers):
+    """The previous path: encode and send inline for each subscriber."""
+    for subscriber in subscribers:
+        sock.sendto(json.dumps(message).encode(), subscriber)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=20)
+    parser.add_argument('--senders', type=int, default=2)
+    parser.add_argument('--counts', type=int, nargs='+', default=SUBSCRIBER_COUNTS)
+    args = parser.parse_args()
+
+    sinks = make_sinks(SINK_SOCKETS)
+    addresses = [sink.getsockname() for sink in sinks]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    engine = FanoutEngine(sock, args.senders)
+    message = {'type': 'publish', 'topic': 'benchmark', 'message': 'x' * 200}
+
+    print(f"{'subscribers':>12}  {'legacy msg/s':>14}  {'engine msg/s':>14}  {'submit (us)':>12}")
+    for count in args.counts:
+        subscribers = [addresses[i % len(addresses)] for i in range(count)]
+
+        start = time.perf_counter()
+        for _ in range(args.publishes):
+            legacy_fanout(sock, message, subscribers)
+        legacy_rate = count * args.publishes / (time.perf_counter() - start)
+
+        submit_time = 0.0
+        start = time.perf_counter()
+        for _ in range(args.publishes):
+            submitted = time.perf_counter()
+            engine.submit([json.dumps(message).encode()], subscribers)
+            submit_time += time.perf_counter() - submitted
+        engine.join()
+        engine_rate = count * args.publishes / (time.perf_counter() - start)
+
+        print(f"{count:>12}  {legacy_rate:>14.0f}  {engine_rate:>14.0f}  "
+              f"{submit_time / args.publishes * 1e6:>12.1f}")
+
+    if engine.dropped or engine.errors:
+        print(f"dropped={engine.dropped} errors={engine.errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark: publish throughput of a peer node run with 1, 2, 4, ... SO_REUSEPORT worker processes."""
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from codec import decode_message, encode_message
+from indexing_server import IndexingServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOCKETS_PER_PUBLISHER = 16  # Distinct source ports, so SO_REUSEPORT spreads each publisher across workers
+
+
+def publisher(port, topics, payload, duration, sent):
+    """Send publishes to the node as fast as possible for duration seconds."""
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(SOCKETS_PER_PUBLISHER)]
+    messages = [encode_message({'type': 'publish', 'topic': topic, 'message': payload}) for topic in topics]
+    address = ('localhost', port)
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            sockets[count % len(sockets)].sendto(messages[count % len(messages)], address)
+            count += 1
+    with sent.get_lock():
+        sent.value += count
+
+
+def worker_stats(port, workers):
+    """Ask the node for stats from fresh source ports until every worker has answered."""
+    stats = {}
+    for _ in range(100 * workers):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(1.0)
+            sock.sendto(encode_message({'type': 'stats'}), ('localhost', port))
+            try:
+                reply = decode_message(sock.recvfrom(65535)[0])['stats']
+            except socket.timeout:
+                continue  # That worker is still draining its receive buffer, or the request was dropped
+        stats[reply['gauges']['worker']] = reply
+        if len(stats) == workers:
+            break
+    return stats
+
+
+def run(workers, args, index_port, port):
+    node = subprocess.Popen([sys.executable, os.path.join(HERE, 'peer_workers.py'), '--port', str(port),
+                             '--workers', str(workers), '--index-port', str(index_port)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0 + 0.2 * workers)  # Let every worker bind and register
+        topics = [f"topic-{i}" for i in range(args.topics)]
+        sinks = []  # Subscribers that never read: fan-out cost is paid, deliveries are dropped by the kernel
+        for topic in topics:
+            sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sink.bind(('localhost', 0))
+            sink.sendto(encode_message({'type': 'subscribe', 'topic': topic}), ('localhost', port))
+            sinks.append(sink)
+        time.sleep(0.5)
+
+        sent = multiprocessing.Value('q', 0)
+        payload = 'x' * args.payload_size
+        publishers = [multiprocessing.Process(target=publisher, args=(port, topics, payload, args.duration, sent))
+                      for _ in range(args.publishers)]
+        started = time.perf_counter()
+        for process in publishers:
+            process.start()
+        for process in publishers:
+            process.join()
+
+        # Workers keep handling what their receive buffers hold after the publishers stop;
+        # the run ends when the publish counts stop growing
+        handled = -1
+        while True:
+            stats = worker_stats(port, workers)
+            total = sum(s['counters'].get('messages.publish', 0) for s in stats.values())
+            if total == handled:
+                break
+            handled, elapsed = total, time.perf_counter() - started
+            time.sleep(0.2)
+        if len(stats) < workers:
+            print(f"warning: only {len(stats)} of {workers} workers answered the stats request")
+        handed_off = sum(s['counters'].get('handed_off', 0) for s in stats.values())
+        for sink in sinks:
+            sink.close()
+        return sent.value, handled, handed_off, elapsed
+    finally:
+        node.terminate()
+        node.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts to compare')
+    parser.add_argument('--publishers', type=int, default=4, help='Publisher processes')
+    parser.add_argument('--topics', type=int, default=64)
+    parser.add_argument('--payload-size', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=9300, help='Indexing server port; nodes use the ports after it')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # Keep per-request logging out of the timings
+    server = IndexingServer('localhost', args.port)
+    threading.Thread(target=server.start_async, daemon=True).start()
+    time.sleep(0.3)
+
+    print(f"{os.cpu_count()} CPUs, {args.publishers} publisher processes, {args.topics} topics")
+    baseline = None
+    for i, workers in enumerate(int(w) for w in args.workers.split(',')):
+        sent, handled, handed_off, elapsed = run(workers, args, args.port, args.port + 1 + i)
+        rate = handled / elapsed
+        baseline = baseline or rate
+        print(f"{workers} workers: {rate:.0f} publishes/s handled ({rate / baseline:.2f}x), "
+              f"{sent / args.duration:.0f}/s offered, {handed_off / max(handled, 1):.0%} handed to the topic owner")
+
+
+if __name__ == '__main__':
+    main()
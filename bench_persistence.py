@@ -0,0 +1,77 @@
+"""Benchmark: durable write latency under churn and recovery time of a persisted IndexingServer."""
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+from indexing_server import IndexingServer
+
+ADDR = ('localhost', 0)
+
+
+def churn(server, writers, operations):
+    """Run writers threads each adding and deleting topics durably; returns per-write latencies."""
+    latencies = []
+
+    def writer(peer_id):
+        server.process_request({'action': 'register', 'peer_id': peer_id, 'peer_port': peer_id}, ADDR)
+        local = []
+        for i in range(operations):
+            action = 'add_topic' if i % 2 == 0 else 'delete_topic'
+            start = time.perf_counter()
+            _, seq = server.execute_request({'action': action, 'peer_id': peer_id, 'topic': f"churn-{i // 2}"}, ADDR)
+            server.wal.wait_durable(seq)
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    threads = [threading.Thread(target=writer, args=(peer_id,)) for peer_id in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--topics', type=int, default=10 ** 6)
+    parser.add_argument('--peers', type=int, default=1000)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=500, help='Durable writes per writer thread')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # Keep per-call logging out of the timings
+    directory = tempfile.mkdtemp(prefix='indexing-wal-')
+    try:
+        server = IndexingServer(data_dir=directory, snapshot_every=args.topics * 2)
+        latencies, elapsed = churn(server, args.writers, args.operations)
+        count = len(latencies)
+        print(f"durable writes: {count / elapsed:.0f}/s with {args.writers} writers, "
+              f"p50 {latencies[count // 2] * 1e3:.2f} ms, p99 {latencies[int(count * 0.99)] * 1e3:.2f} ms")
+
+        base = args.writers
+        for peer_id in range(base, base + args.peers):
+            server.register_peer(peer_id, 'localhost', peer_id)
+        for i in range(args.topics):
+            server.add_topic(base + i % args.peers, f"topic-{i}")
+        server.wal.wait_durable(server.wal.appended)
+
+        started = time.perf_counter()
+        IndexingServer(data_dir=directory)
+        print(f"recovery from log only: {args.topics} topics in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        server.snapshot()
+        print(f"snapshot written in {time.perf_counter() - started:.2f}s")
+        started = time.perf_counter()
+        IndexingServer(data_dir=directory)
+        print(f"recovery from snapshot: {args.topics} topics in {time.perf_counter() - started:.2f}s")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
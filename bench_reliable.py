@@ -0,0 +1,182 @@
+"""Loss-injection check: plain vs reliable delivery through lossy links, and a slow reliable consumer.
+
+Every client talks to the peer node through a proxy that drops the given share
+of datagrams in each direction. Reliable subscriptions must receive every
+message the node accepted exactly once and in offset order (reliable publishes
+are used so acknowledged messages are never lost on the way in); the script
+exits non-zero if one does not. The slow-consumer run checks that a subscriber
+that cannot keep up does not hold back a fast one.
+"""
+import argparse
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+from client_api import ClientAPI
+from indexing_server import IndexingServer
+from peer_node import PeerNode
+
+
+class LossyProxy:
+    """Relays datagrams between one client and a peer node, dropping each with probability loss."""
+
+    def __init__(self, target, loss, seed):
+        self.target = target
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Faces the client
+        self.front.bind(('127.0.0.1', 0))
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Faces the peer node
+        self.back.bind(('127.0.0.1', 0))
+        self.client = None
+        self.dropped = 0
+        threading.Thread(target=self.relay, args=(self.front, self.back, True), daemon=True).start()
+        threading.Thread(target=self.relay, args=(self.back, self.front, False), daemon=True).start()
+
+    @property
+    def address(self):
+        return self.front.getsockname()
+
+    def relay(self, source, sink, outbound):
+        while True:
+            data, addr = source.recvfrom(65535)
+            if outbound:
+                self.client = addr
+            if self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+            sink.sendto(data, self.target if outbound else self.client)
+
+
+def lossy_client(node, loss, seed, **options):
+    client = ClientAPI(**options)
+    proxy = LossyProxy(('127.0.0.1', node.port), loss, seed)
+    client.peer_host, client.peer_port = proxy.address
+    client.start_receiving()
+    return client, proxy
+
+
+def publish_all(publisher, topic, count, threads):
+    """Publish count numbered messages reliably from several threads; returns the numbers acknowledged."""
+    acked = []
+
+    def run(numbers):
+        acked.extend(n for n in numbers if publisher.publish(topic, str(n), reliable=True))
+
+    workers = [threading.Thread(target=run, args=(range(i, count, threads),)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return set(acked)
+
+
+def wait_for(clients, count, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(len(client.received_messages) < count for client in clients):
+        time.sleep(0.05)
+
+
+def check(messages, expected, accepted):
+    """Return (delivered, duplicates, in order, complete): complete means every expected message number and
+    nothing beyond the accepted count of messages arrived."""
+    numbers = [int(message['message']) for message in messages]
+    offsets = [message['offset'] for message in messages]
+    in_order = all(b == a + 1 for a, b in zip(offsets, offsets[1:]))
+    return len(set(numbers)), len(numbers) - len(set(numbers)), in_order, \
+        set(numbers) >= expected and len(set(numbers)) == accepted
+
+
+def loss_run(node, loss, args, seed):
+    topic = f"loss-{loss}"
+    plain, _ = lossy_client(node, loss, seed)
+    reliable, proxy = lossy_client(node, loss, seed + 1)
+    publisher, _ = lossy_client(node, loss, seed + 2)
+    plain.subscribe(topic)
+    reliable.subscribe(topic, reliable=True)
+    time.sleep(0.5)  # Lost plain subscribes are not retried; give the reliable one time to be repeated
+
+    started = time.monotonic()
+    acked = publish_all(publisher, topic, args.messages, args.publish_threads)
+    time.sleep(0.2)  # Retries of publishes whose ack was lost may still be arriving
+    accepted = node.retention.bounds(topic)[1]  # Messages the node took in, acknowledged or not
+    wait_for([reliable], accepted, args.timeout)
+    elapsed = time.monotonic() - started
+    time.sleep(0.2)  # Let late duplicates show up
+    return len(acked), check(plain.received_messages, acked, accepted), \
+        check(reliable.received_messages, acked, accepted), elapsed, proxy.dropped, reliable.reliable.stats()
+
+
+def slow_run(args):
+    node = PeerNode(port=args.port + 2, indexing_server_port=args.port, retention=True,
+                    retention_messages=args.slow_retention, slow_policy=args.slow_policy)
+    topic = 'slow-consumer'
+    fast, _ = lossy_client(node, 0.0, 1)
+    slow, _ = lossy_client(node, 0.0, 2)
+    slow.message_handler = lambda message: time.sleep(args.slow_delay)
+    fast.subscribe(topic, reliable=True)
+    slow.subscribe(topic, reliable=True)
+    time.sleep(0.3)
+
+    publisher = ClientAPI()
+    publisher.peer_host, publisher.peer_port = 'localhost', node.port
+    started = time.monotonic()
+    for n in range(args.messages):
+        publisher.publish(topic, str(n))
+        time.sleep(1 / args.slow_rate)
+    wait_for([fast], args.messages, args.timeout)
+    fast_elapsed = time.monotonic() - started
+    time.sleep(1.0)
+    return check(fast.received_messages, set(range(args.messages)), args.messages), fast_elapsed, \
+        len(slow.received_messages), node.reliable.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.01, 0.05, 0.2],
+                        help='Shares of datagrams dropped in each direction')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--publish-threads', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for a run to complete')
+    parser.add_argument('--slow-delay', type=float, default=0.005, help='Seconds the slow consumer spends per message')
+    parser.add_argument('--slow-retention', type=int, default=256, help='Messages retained in the slow-consumer run')
+    parser.add_argument('--slow-rate', type=float, default=1000.0, help='Publishes per second in the slow-consumer run')
+    parser.add_argument('--slow-policy', choices=('skip', 'drop'), default='skip')
+    parser.add_argument('--port', type=int, default=9400, help='Indexing server port; peer nodes use the ports after it')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    server = IndexingServer('localhost', args.port)
+    threading.Thread(target=server.start_async, daemon=True).start()
+    time.sleep(0.3)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')  # Clients and nodes print every message
+    failed = False
+    node = PeerNode(port=args.port + 1, indexing_server_port=args.port, retention=True)
+    for i, loss in enumerate(args.loss):
+        acked, plain, reliable, elapsed, dropped, receiver = loss_run(node, loss, args, 10 * i)
+        complete = reliable[3] and reliable[2] and not reliable[1]
+        failed = failed or not complete
+        print(f"loss {loss:>5.0%}: {acked}/{args.messages} publishes acked, "
+              f"plain received {plain[0]} ({plain[1]} duplicates), "
+              f"reliable received {reliable[0]} ({reliable[1]} duplicates, "
+              f"{'in order' if reliable[2] else 'OUT OF ORDER'}) in {elapsed:.2f}s; "
+              f"{dropped} datagrams dropped on the reliable link, {receiver['duplicates']} retransmits "
+              f"discarded as duplicates -> {'ok' if complete else 'FAILED'}", file=stdout)
+    print(f"reliable sender: {node.reliable.stats()}", file=stdout)
+
+    fast, fast_elapsed, slow_received, sender = slow_run(args)
+    failed = failed or not fast[3]
+    print(f"slow consumer ({args.slow_delay * 1e3:.0f} ms/message, {args.slow_retention} retained, "
+          f"policy '{args.slow_policy}'): fast subscriber received {fast[0]}/{args.messages} "
+          f"in {fast_elapsed:.2f}s ({args.messages / args.slow_rate:.2f}s of publishing) "
+          f"-> {'ok' if fast[3] else 'FAILED'}; slow subscriber had handled {slow_received} a second later; "
+          f"sender: {sender}", file=stdout)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: query_topic throughput of a sharded indexing tier versus shard count."""
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from shard_ring import ShardRouter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHARD_COUNTS = [1, 2, 4]
+PEER_ID = 7000
+
+
+def start_shards(base_port, count):
+    """Launch count shard processes and wait until every one accepts connections."""
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'indexing_server.py'),
+                                '--port', str(base_port), '--shards', str(count)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    shards = [('localhost', base_port + i) for i in range(count)]
+    deadline = time.time() + 10
+    for shard in shards:
+        while True:
+            try:
+                socket.create_connection(shard, timeout=0.2).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    process.kill()
+                    raise RuntimeError(f"Shard {shard} did not start")
+                time.sleep(0.05)
+    return process, shards
+
+
+def query_worker(shards, topics, duration):
+    """Client process: issue query_topic requests for duration seconds and return how many completed."""
+    router = ShardRouter(shards, pool_size=1)
+    completed = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        router.request({'action': 'query_topic', 'topic': random.choice(topics)})
+        completed += 1
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--clients', type=int, default=8, help='Client processes issuing queries')
+    parser.add_argument('--topics', type=int, default=10000)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--counts', type=int, nargs='+', default=SHARD_COUNTS)
+    args = parser.parse_args()
+
+    topics = [f"topic-{i}" for i in range(args.topics)]
+    print(f"{'shards':>7}  {'queries/sec':>12}   ({os.cpu_count()} CPUs, {args.clients} client processes)")
+    for count in args.counts:
+        process, shards = start_shards(args.port, count)
+        try:
+            router = ShardRouter(shards)
+            router.request({'action': 'register', 'peer_id': PEER_ID, 'peer_port': PEER_ID})
+            router.request({'action': 'register_topics', 'peer_id': PEER_ID, 'topics': topics})
+            with multiprocessing.Pool(args.clients) as pool:
+                completed = pool.starmap(query_worker, [(shards, topics, args.duration)] * args.clients)
+            print(f"{count:>7}  {sum(completed) / args.duration:>12.0f}")
+        finally:
+            process.terminate()
+            process.wait()
+        args.port += count
+
+
+if __name__ == '__main__':
+    main()
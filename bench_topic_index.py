@@ -0,0 +1,53 @@
+"""Micro-benchmark: IndexingServer.unregister_peer latency versus total topic count."""
+import argparse
+import logging
+import time
+
+from indexing_server import IndexingServer
+
+TOPIC_COUNTS = [10 ** 4, 10 ** 5, 10 ** 6]
+BACKGROUND_PEERS = 1000  # Peers sharing the bulk of the topics
+VICTIM_TOPICS = 10  # Topics held by the peer that churns
+REPEATS = 200
+
+
+def build_server(topic_count):
+    """Return a server holding topic_count topics spread across the background peers."""
+    server = IndexingServer()
+    for peer_id in range(BACKGROUND_PEERS):
+        server.register_peer(peer_id, 'localhost', peer_id)
+    for i in range(topic_count):
+        server.add_topic(i % BACKGROUND_PEERS, f"topic-{i}")
+    return server
+
+
+def measure_unregister(server, repeats):
+    """Average seconds to unregister a peer holding VICTIM_TOPICS topics."""
+    victim = 'victim'
+    total = 0.0
+    for _ in range(repeats):
+        server.register_peer(victim, 'localhost', 0)
+        for i in range(VICTIM_TOPICS):
+            server.add_topic(victim, f"topic-{i}")
+        start = time.perf_counter()
+        server.unregister_peer(victim)
+        total += time.perf_counter() - start
+    return total / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--counts', type=int, nargs='+', default=TOPIC_COUNTS)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # Keep per-call logging out of the timings
+    print(f"{'topics':>10}  {'unregister (us)':>16}")
+    for topic_count in args.counts:
+        server = build_server(topic_count)
+        latency = measure_unregister(server, args.repeats)
+        print(f"{topic_count:>10}  {latency * 1e6:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
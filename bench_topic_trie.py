@@ -0,0 +1,58 @@
+"""Micro-benchmark: matching a published topic against N wildcard subscriptions, trie versus linear scan."""
+import argparse
+import random
+import time
+
+from topic_trie import TopicTrie, topic_matches
+
+PATTERN_COUNTS = [10 ** 3, 10 ** 4, 10 ** 5]
+DEPTH = 4  # Levels per topic: region/site/device/metric
+FANOUT = 32  # Distinct names per level
+LOOKUPS = 2000
+
+
+def random_topic(rng):
+    return '/'.join(f"n{rng.randrange(FANOUT)}" for _ in range(DEPTH))
+
+
+def random_pattern(rng):
+    """A topic with some levels replaced by '*', or cut short by '#'."""
+    levels = [level if rng.random() < 0.8 else '*' for level in random_topic(rng).split('/')]
+    if rng.random() < 0.2:
+        levels = levels[:rng.randrange(1, DEPTH)] + ['#']
+    return '/'.join(levels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--counts', type=int, nargs='+', default=PATTERN_COUNTS)
+    parser.add_argument('--lookups', type=int, default=LOOKUPS)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    topics = [random_topic(rng) for _ in range(args.lookups)]
+    print(f"{'patterns':>10}  {'trie match (us)':>16}  {'linear scan (us)':>17}  {'matches/topic':>14}")
+    for count in args.counts:
+        patterns = [random_pattern(rng) for _ in range(count)]
+        trie = TopicTrie()
+        for pattern in patterns:
+            trie.setdefault(pattern, {})
+
+        matched = 0
+        start = time.perf_counter()
+        for topic in topics:
+            matched += sum(1 for _ in trie.match(topic))
+        trie_time = (time.perf_counter() - start) / len(topics)
+
+        scanned = topics[:max(1, len(topics) * 1000 // count)]  # The scan is slow: time fewer lookups
+        start = time.perf_counter()
+        for topic in scanned:
+            sum(1 for pattern in trie.items() if topic_matches(pattern[0], topic))
+        scan_time = (time.perf_counter() - start) / len(scanned)
+
+        print(f"{count:>10}  {trie_time * 1e6:>16.2f}  {scan_time * 1e6:>17.2f}  {matched / len(topics):>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
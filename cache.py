@@ -0,0 +1,67 @@
+import collections
+import threading
+import time
+
+DEFAULT_CACHE_SIZE = 4096  # Entries kept before the least recently used is evicted
+DEFAULT_CACHE_TTL = 5.0  # Seconds an entry is trusted without a server-pushed invalidation
+MAX_CACHE_TTL = 300.0  # Longest cache TTL an indexing server watch protects
+
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries also expire after a fixed TTL.
+
+    Hit, miss, eviction and invalidation counts are kept so the cache can be sized.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()  # {key: (expires_at, value)}, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None, accept=None):
+        """Return the live value for key, or default.
+
+        accept, if given, is called with the cached value; a value it rejects is
+        treated (and counted) as a miss but kept in the cache.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and accept is not None and entry[0] > time.monotonic() and not accept(entry[1]):
+                self.misses += 1
+                return default
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def keys(self):
+        """Return the cached keys, including ones whose entries have expired but were not yet dropped."""
+        with self.lock:
+            return list(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
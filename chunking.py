@@ -0,0 +1,126 @@
+import collections
+import os
+import struct
+import time
+
+# Publishes larger than one chunk are split into fragment datagrams:
+#   magic (1) | message id (8) | chunk index (4) | chunk count (4) | chunk bytes
+FRAGMENT_MAGIC = 0xC5  # Distinct from JSON ('{') and the binary codec's magic byte
+FRAGMENT_HEADER = struct.Struct('!BQII')
+MAX_DATAGRAM_SIZE = 65507  # Largest UDP payload over IPv4; also the size of reusable receive buffers
+DEFAULT_CHUNK_SIZE = 8192  # Message bytes carried per fragment
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # Largest message accepted for reassembly
+MAX_FRAGMENTS = 32768  # Largest chunk count accepted, bounding per-message bookkeeping
+
+DEFAULT_MAX_PENDING = 64  # Partially received messages kept per receiver
+DEFAULT_MAX_PENDING_BYTES = 64 * 1024 * 1024  # Memory bound across all partial messages
+DEFAULT_REASSEMBLY_TIMEOUT = 5.0  # Seconds to wait for the missing fragments of a message
+
+_next_message_id = int.from_bytes(os.urandom(8), 'big')
+
+
+def new_message_id():
+    """Return a message id unique within this process (random start, then sequential)."""
+    global _next_message_id
+    _next_message_id = (_next_message_id + 1) & 0xFFFFFFFFFFFFFFFF
+    return _next_message_id
+
+
+def reseed_message_ids():
+    """Pick a new random starting id; call in a forked process so it does not repeat its parent's ids."""
+    global _next_message_id
+    _next_message_id = int.from_bytes(os.urandom(8), 'big')
+
+
+def fragment(payload, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split an encoded message into datagrams; small messages are sent as-is."""
+    if len(payload) <= chunk_size:
+        return [payload]
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {len(payload)} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit")
+    count = (len(payload) + chunk_size - 1) // chunk_size
+    if count > MAX_FRAGMENTS:
+        raise ValueError(f"Message would need {count} fragments; use a larger chunk size")
+    message_id = new_message_id()
+    view = memoryview(payload)
+    return [FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id, index, count) + view[start:start + chunk_size]
+            for index, start in enumerate(range(0, len(payload), chunk_size))]
+
+
+class PartialMessage:
+    __slots__ = ('chunks', 'received', 'size', 'started')
+
+    def __init__(self, count, started):
+        self.chunks = [None] * count
+        self.received = 0
+        self.size = 0
+        self.started = started
+
+
+class Reassembler:
+    """Rebuilds fragmented messages from datagrams, with bounded memory.
+
+    Partial messages are dropped when they time out or when the limits on
+    pending messages or bytes are exceeded, oldest first.
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, max_pending_bytes=DEFAULT_MAX_PENDING_BYTES,
+                 timeout=DEFAULT_REASSEMBLY_TIMEOUT):
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.timeout = timeout
+        self.pending = collections.OrderedDict()  # {(sender addr, message id): PartialMessage}, oldest first
+        self.pending_bytes = 0
+        self.dropped = 0  # Partial messages abandoned because of timeouts or limits
+
+    def add(self, datagram, addr):
+        """Feed one received datagram.
+
+        Returns the complete message bytes when datagram finishes a message (or is
+        not a fragment at all), otherwise None.
+        """
+        if not datagram or datagram[0] != FRAGMENT_MAGIC:
+            return datagram
+        if len(datagram) < FRAGMENT_HEADER.size:
+            raise ValueError("Truncated fragment header")
+        _, message_id, index, count = FRAGMENT_HEADER.unpack_from(datagram)
+        if not 0 <= index < count <= MAX_FRAGMENTS:
+            raise ValueError("Invalid fragment header")
+
+        now = time.monotonic()
+        self.expire(now)
+        key = (addr, message_id)
+        partial = self.pending.get(key)
+        if partial is None:
+            partial = self.pending[key] = PartialMessage(count, now)
+        if index >= len(partial.chunks) or partial.chunks[index] is not None:
+            return None  # Duplicate or inconsistent fragment
+        chunk = bytes(datagram[FRAGMENT_HEADER.size:])
+        partial.chunks[index] = chunk
+        partial.received += 1
+        partial.size += len(chunk)
+        self.pending_bytes += len(chunk)
+
+        if partial.received == len(partial.chunks):
+            del self.pending[key]
+            self.pending_bytes -= partial.size
+            return b''.join(partial.chunks)
+        self.enforce_limits()
+        return None
+
+    def expire(self, now):
+        """Drop partial messages older than the reassembly timeout."""
+        while self.pending:
+            key, partial = next(iter(self.pending.items()))
+            if now - partial.started < self.timeout:
+                break
+            self.discard(key)
+
+    def enforce_limits(self):
+        while self.pending and (len(self.pending) > self.max_pending or self.pending_bytes > self.max_pending_bytes):
+            self.discard(next(iter(self.pending)))
+
+    def discard(self, key):
+        partial = self.pending.pop(key)
+        self.pending_bytes -= partial.size
+        self.dropped += 1
@@ -1,14 +1,35 @@
 import socket
 import threading
-import json
 import signal
 import sys
 
+from cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL, MAX_CACHE_TTL, TTLCache
+from chunking import MAX_DATAGRAM_SIZE, Reassembler, fragment, new_message_id
+from codec import JSON, WIRE_FORMATS, decode_message, encode_message
+from connection_pool import DEFAULT_POOL_SIZE, get_pool
+from reliable import DEFAULT_RECEIVE_WINDOW, ReliableReceiver
+from shard_ring import ShardRouter
+from topic_trie import is_pattern, prefix_pattern, topic_matches
+
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # Requested kernel receive buffer so fragment bursts are not dropped
+PUBLISH_ACK_TIMEOUT = 0.2  # Seconds a reliable publish waits for the peer node's ack before resending
+PUBLISH_ATTEMPTS = 10  # Sends of a reliable publish before giving up
+
 class ClientAPI:
-    def __init__(self, client_port=None):
+    def __init__(self, client_port=None, pool_size=DEFAULT_POOL_SIZE, wire_format=JSON, index_shards=None,
+                 cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL, watch_invalidations=True,
+                 receive_window=DEFAULT_RECEIVE_WINDOW, index_pool=None):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire format '{wire_format}'")
         self.peer_host = None
         self.peer_port = None
+        self.pool_size = pool_size  # Persistent connections kept per indexing server
+        self.wire_format = wire_format  # Encoding for index requests and publish/subscribe messages
+        # With a sharded indexing tier, every index request is routed by topic across these addresses
+        self.shard_router = ShardRouter(index_shards, pool_size, wire_format) if index_shards else None
+        self.index_pool = index_pool  # Dedicated ConnectionPool for index requests instead of the process-wide one
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
 
         # Bind the client socket to a random port for receiving messages
         if client_port is None:
@@ -16,7 +37,34 @@ class ClientAPI:
         else:
             self.client_socket.bind(('localhost', client_port))
 
+        self.reassembler = Reassembler()  # Rebuilds messages that arrive as several fragments
         self.received_messages = []
+        self.message_handler = None  # Optional callable invoked with each received message
+        self.receiving = False  # Whether the receive thread has been started
+
+        # Reliable delivery: subscriptions are put back in order and acknowledged by a ReliableReceiver
+        # (created with the first one) advertising receive_window; reliable publishes wait for an ack
+        self.receive_window = receive_window
+        self.reliable = None
+        self.pending_publishes = {}  # {seq: threading.Event} of reliable publishes awaiting their ack
+
+        # Resolution caches: topic -> (candidates requested, [(peer_id, (host, port))]) and the peer list.
+        # With watch_invalidations the indexing server pushes a one-shot notice to this socket when a
+        # cached answer changes (handled while start_receiving is running); the TTL bounds staleness otherwise.
+        # The TTL is sent with each watched query so the watch lasts as long as the entry; servers only keep a
+        # watch for up to MAX_CACHE_TTL, so longer TTLs are capped at it.
+        if watch_invalidations:
+            cache_ttl = min(cache_ttl, MAX_CACHE_TTL)
+        self.cache_ttl = cache_ttl
+        self.topic_cache = TTLCache(cache_size, cache_ttl) if cache_size else None
+        self.peer_cache = TTLCache(1, cache_ttl) if cache_size else None
+        self.pattern_cache = TTLCache(cache_size, cache_ttl) if cache_size else None  # pattern -> {topic: holder}
+        self.watch_invalidations = watch_invalidations
+        # An invalidation can arrive before the answer it invalidates, so cacheable queries are tracked while
+        # in flight and an answer is not cached if its key was invalidated meanwhile
+        self.query_lock = threading.Lock()
+        self.queries_in_flight = {}  # {('topic' | 'pattern' | 'peers', key): number of queries awaiting an answer}
+        self.stale_queries = set()  # Keys of queries in flight that were invalidated
         print(f"Client started, listening on {self.client_socket.getsockname()}")
 
         # Setup signal handler for graceful exit
@@ -30,57 +78,69 @@ class ClientAPI:
     def select_peer_node(self, indexing_server_host='localhost', indexing_server_port=9000):
         """Query the indexing server to retrieve available peer nodes."""
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((indexing_server_host, indexing_server_port))
-                request = {'action': 'get_peers'}
-                s.send(json.dumps(request).encode('utf-8'))
-                response = json.loads(s.recv(1024).decode('utf-8'))
-
-                if response['status'] == 'success' and response['peers']:
-                    # Display the list of available peers and allow the user to choose
-                    print("Available peer nodes:")
-                    for idx, (peer_id, (host, port)) in enumerate(response['peers'].items()):
-                        print(f"{idx + 1}: {peer_id} at {host}:{port}")
-
-                    while True:
-                        choice = input("Select a peer node to connect to (enter the number): ")
-                        try:
-                            choice = int(choice)
-                            if 1 <= choice <= len(response['peers']):
-                                break
-                            else:
-                                print("Please select a valid number.")
-                        except ValueError:
-                            print("Invalid input. Please enter a number.")
-
-                    peer_id = list(response['peers'].keys())[choice - 1]
-                    self.peer_host, self.peer_port = response['peers'][peer_id]
-                    print(f"Selected peer node {peer_id} at {self.peer_host}:{self.peer_port}")
-                else:
-                    print("No available peer nodes.")
+            peers = self.get_peers(indexing_server_host, indexing_server_port)
+
+            if peers:
+                # Display the list of available peers and allow the user to choose
+                print("Available peer nodes:")
+                for idx, (peer_id, (host, port)) in enumerate(peers.items()):
+                    print(f"{idx + 1}: {peer_id} at {host}:{port}")
+
+                while True:
+                    choice = input("Select a peer node to connect to (enter the number): ")
+                    try:
+                        choice = int(choice)
+                        if 1 <= choice <= len(peers):
+                            break
+                        else:
+                            print("Please select a valid number.")
+                    except ValueError:
+                        print("Invalid input. Please enter a number.")
+
+                peer_id = list(peers.keys())[choice - 1]
+                self.peer_host, self.peer_port = peers[peer_id]
+                print(f"Selected peer node {peer_id} at {self.peer_host}:{self.peer_port}")
+            else:
+                print("No available peer nodes.")
         except Exception as e:
             print(f"Error querying indexing server: {e}")
 
+    def get_peers(self, indexing_server_host='localhost', indexing_server_port=9000):
+        """Return the registered peer nodes as {peer_id: (host, port)}, served from cache when fresh."""
+        if self.peer_cache is not None:
+            peers = self.peer_cache.get('peers')
+            if peers is not None:
+                return peers
+        use_cache = self.peer_cache is not None
+        if use_cache:
+            self._start_query(('peers', None))
+        try:
+            response = self._index_request(self._watched({'action': 'get_peers'}), indexing_server_host, indexing_server_port)
+        finally:
+            cacheable = use_cache and self._finish_query(('peers', None))
+        peers = {peer_id: tuple(info) for peer_id, info in response['peers'].items()} if response['status'] == 'success' else {}
+        if cacheable:
+            self.peer_cache.put('peers', peers)
+        return peers
+
     def create_topic(self, topic, indexing_server_host='localhost', indexing_server_port=9000):
         """Create a topic and register it with the indexing server."""
         if self.peer_host and self.peer_port:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((indexing_server_host, indexing_server_port))
-                    create_topic_message = {
-                        'action': 'add_topic',  # Use 'add_topic' instead of 'create_topic'
-                        'topic': topic,
-                        'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
-                    }
-                    s.send(json.dumps(create_topic_message).encode('utf-8'))
-                    response = json.loads(s.recv(1024).decode('utf-8'))
-                    print(f"Create topic response: {response}")
-
-                    # If topic exists, subscribe to it
-                    if response['status'] == 'error':
-                        print(f"Topic '{topic}' already exists. Subscribing to the existing topic.")
-                        self.subscribe(topic)
-                    return response['status'] == 'success'
+                create_topic_message = {
+                    'action': 'add_topic',  # Use 'add_topic' instead of 'create_topic'
+                    'topic': topic,
+                    'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
+                }
+                response = self._index_request(create_topic_message, indexing_server_host, indexing_server_port)
+                print(f"Create topic response: {response}")
+                self.invalidate_cached_topics([topic])
+
+                # If topic exists, subscribe to it
+                if response['status'] == 'error':
+                    print(f"Topic '{topic}' already exists. Subscribing to the existing topic.")
+                    self.subscribe(topic)
+                return response['status'] == 'success'
             except Exception as e:
                 print(f"Error creating topic: {e}")
         else:
@@ -91,25 +151,265 @@ class ClientAPI:
         """Delete a topic from the indexing server."""
         if self.peer_host and self.peer_port:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((indexing_server_host, indexing_server_port))
-                    delete_topic_message = {
-                        'action': 'delete_topic',
-                        'topic': topic,
-                        'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
-                    }
-                    s.send(json.dumps(delete_topic_message).encode('utf-8'))
-                    response = json.loads(s.recv(1024).decode('utf-8'))
-                    print(f"Delete topic response: {response}")
-                    return response['status'] == 'success'
+                delete_topic_message = {
+                    'action': 'delete_topic',
+                    'topic': topic,
+                    'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
+                }
+                response = self._index_request(delete_topic_message, indexing_server_host, indexing_server_port)
+                print(f"Delete topic response: {response}")
+                self.invalidate_cached_topics([topic])
+                return response['status'] == 'success'
             except Exception as e:
                 print(f"Error deleting topic: {e}")
         else:
             print("Peer node is not selected.")
         return False
 
-    def publish(self, topic, message):
-        """Publish a message to a topic."""
+    def query_topic(self, topic, count=None, strategy=None, indexing_server_host='localhost', indexing_server_port=9000):
+        """Resolve the peer nodes holding a topic.
+
+        Returns a list of (peer_id, (host, port)) candidates, best first. Pass count to
+        receive up to that many candidates for fail-over or fan-out, and strategy to
+        override the server's selection policy ('first', 'round_robin', 'random',
+        'least_subscribers' or 'least_load').
+
+        Answers under the server's default policy are cached; naming a strategy
+        always asks the server, since policies like round_robin vary per query.
+        """
+        wanted = count or 1
+        use_cache = self.topic_cache is not None and strategy is None
+        if use_cache:
+            cached = self.topic_cache.get(topic, accept=lambda entry: entry[0] >= wanted)
+            if cached is not None:
+                return cached[1][:wanted]
+        try:
+            query_message = {'action': 'query_topic', 'topic': topic}
+            if count is not None:
+                query_message['count'] = count
+            if strategy is not None:
+                query_message['strategy'] = strategy
+            if use_cache:
+                self._start_query(('topic', topic))
+            try:
+                response = self._index_request(self._watched(query_message), indexing_server_host, indexing_server_port)
+            finally:
+                cacheable = use_cache and self._finish_query(('topic', topic))
+            if response['status'] != 'success':
+                print(f"Query topic response: {response}")
+                return []
+            if 'peers' in response:
+                candidates = [(p['peer_id'], tuple(p['peer_info'])) for p in response['peers']]
+            else:
+                candidates = [(response['peer_id'], tuple(response['peer_info']))]
+            if cacheable:
+                self.topic_cache.put(topic, (wanted, candidates))
+            return candidates
+        except Exception as e:
+            print(f"Error querying topic: {e}")
+        return []
+
+    def query_prefix(self, prefix, strategy=None, indexing_server_host='localhost', indexing_server_port=9000):
+        """Resolve every topic at or below prefix, taken as whole levels ('sensors/eu' covers 'sensors/eu/paris').
+
+        Returns {topic: (peer_id, (host, port))}, like query_matching.
+        """
+        query_message = {'action': 'query_topic', 'topic': prefix, 'prefix': True}
+        return self._query_matching(prefix_pattern(prefix), query_message, strategy,
+                                    indexing_server_host, indexing_server_port)
+
+    def query_matching(self, pattern, strategy=None, indexing_server_host='localhost', indexing_server_port=9000):
+        """Resolve every topic matching a wildcard pattern.
+
+        Topic levels are separated by '/'; '*' matches exactly one level and '#',
+        as the last level, any number of levels (including none). Returns
+        {topic: (peer_id, (host, port))} with one holder per topic, cached like
+        query_topic answers.
+        """
+        query_message = {'action': 'query_topic', 'topic': pattern}
+        return self._query_matching(pattern, query_message, strategy, indexing_server_host, indexing_server_port)
+
+    def _query_matching(self, pattern, query_message, strategy, indexing_server_host, indexing_server_port):
+        use_cache = self.pattern_cache is not None and strategy is None
+        if use_cache:
+            cached = self.pattern_cache.get(pattern)
+            if cached is not None:
+                return dict(cached)
+        try:
+            if strategy is not None:
+                query_message['strategy'] = strategy
+            if use_cache:
+                self._start_query(('pattern', pattern))
+            try:
+                response = self._index_request(self._watched(query_message), indexing_server_host, indexing_server_port)
+            finally:
+                cacheable = use_cache and self._finish_query(('pattern', pattern))
+            if response['status'] != 'success':
+                print(f"Query pattern response: {response}")
+                return {}
+            results = {result['topic']: (result['peer_id'], tuple(result['peer_info'])) for result in response['topics']}
+            if cacheable:
+                self.pattern_cache.put(pattern, results)
+            return dict(results)
+        except Exception as e:
+            print(f"Error querying pattern: {e}")
+        return {}
+
+    def _watched(self, message):
+        """Ask the indexing server to notify this client's socket when the answer changes."""
+        if self.watch_invalidations and self.topic_cache is not None:
+            message['watch'] = self.client_socket.getsockname()[1]
+            message['watch_ttl'] = self.cache_ttl  # The server keeps the watch as long as the entry is cached
+        return message
+
+    def _start_query(self, key):
+        """Note a cacheable query as in flight until _finish_query."""
+        with self.query_lock:
+            self.queries_in_flight[key] = self.queries_in_flight.get(key, 0) + 1
+
+    def _finish_query(self, key):
+        """Note the answer to a query as received; returns whether it may be cached."""
+        with self.query_lock:
+            remaining = self.queries_in_flight.pop(key) - 1
+            stale = key in self.stale_queries
+            if remaining:
+                self.queries_in_flight[key] = remaining
+            else:
+                self.stale_queries.discard(key)
+            return not stale
+
+    def _invalidate_queries(self, matches):
+        """Mark the queries in flight whose key satisfies matches so their answers are not cached."""
+        with self.query_lock:
+            self.stale_queries.update(key for key in self.queries_in_flight if matches(key))
+
+    def invalidate_cached_topics(self, topics):
+        """Drop the cached answers for topics, and for the cached patterns matching them."""
+        if self.topic_cache is not None:
+            topics = list(topics)
+            for topic in topics:
+                self.topic_cache.invalidate(topic)
+                self.pattern_cache.invalidate(topic)  # Server notices name the pattern of a pattern query
+            for pattern in self.pattern_cache.keys():
+                if any(topic_matches(pattern, topic) for topic in topics):
+                    self.pattern_cache.invalidate(pattern)
+            self._invalidate_queries(lambda key: key[0] != 'peers' and (
+                key[1] in topics or key[0] == 'pattern' and any(topic_matches(key[1], topic) for topic in topics)))
+
+    def handle_invalidation(self, message):
+        """Drop the cache entries named in a server-pushed invalidation."""
+        self.invalidate_cached_topics(message.get('topics', ()))
+        if message.get('peers') and self.peer_cache is not None:
+            self.peer_cache.invalidate('peers')
+            self._invalidate_queries(lambda key: key[0] == 'peers')
+
+    def cache_stats(self):
+        """Return hit/miss/size counters of the topic, peer-list and pattern caches."""
+        if self.topic_cache is None:
+            return {}
+        return {'topics': self.topic_cache.stats(), 'peers': self.peer_cache.stats(),
+                'patterns': self.pattern_cache.stats()}
+
+    def _index_request(self, message, indexing_server_host, indexing_server_port):
+        """Send one request to the indexing server over a pooled connection."""
+        if self.shard_router is not None:
+            return self.shard_router.request(message)
+        if self.index_pool is not None:
+            return self.index_pool.request(message)
+        pool = get_pool((indexing_server_host, indexing_server_port), self.pool_size, self.wire_format)
+        return pool.request(message)
+
+    def create_topics(self, topics, indexing_server_host='localhost', indexing_server_port=9000):
+        """Create many topics in one round trip; returns a success flag per topic."""
+        topics = list(topics)
+        if self.peer_host and self.peer_port:
+            try:
+                response = self._index_request({
+                    'action': 'register_topics',
+                    'topics': topics,
+                    'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
+                }, indexing_server_host, indexing_server_port)
+                if response['status'] != 'success':
+                    print(f"Create topics response: {response}")
+                    return [False] * len(topics)
+                results = [result['status'] == 'success' for result in response['results']]
+                self.invalidate_cached_topics(topics)
+                # Subscribe to any topic that could not be created, as create_topic does
+                for topic, created in zip(topics, results):
+                    if not created:
+                        self.subscribe(topic)
+                return results
+            except Exception as e:
+                print(f"Error creating topics: {e}")
+        else:
+            print("Peer node is not selected.")
+        return [False] * len(topics)
+
+    def delete_topics(self, topics, indexing_server_host='localhost', indexing_server_port=9000):
+        """Delete many topics in one round trip; returns a success flag per topic."""
+        topics = list(topics)
+        if self.peer_host and self.peer_port:
+            try:
+                response = self._index_request({
+                    'action': 'delete_topics',
+                    'topics': topics,
+                    'peer_id': self.client_socket.getsockname()[1]  # Use client's port as peer_id
+                }, indexing_server_host, indexing_server_port)
+                self.invalidate_cached_topics(topics)
+                return [result['status'] == 'success' for result in response['results']]
+            except Exception as e:
+                print(f"Error deleting topics: {e}")
+        else:
+            print("Peer node is not selected.")
+        return [False] * len(topics)
+
+    def query_topics(self, topics, strategy=None, indexing_server_host='localhost', indexing_server_port=9000):
+        """Resolve many topics in one round trip.
+
+        Returns {topic: (peer_id, (host, port))}, with None for topics nobody holds.
+        """
+        topics = list(topics)
+        results = {}
+        use_cache = self.topic_cache is not None and strategy is None
+        if use_cache:
+            for topic in topics:
+                cached = self.topic_cache.get(topic)
+                if cached is not None:
+                    results[topic] = cached[1][0]
+        missing = [topic for topic in topics if topic not in results]
+        if not missing:
+            return {topic: results[topic] for topic in topics}
+        try:
+            query_message = {'action': 'query_topics', 'topics': missing}
+            if strategy is not None:
+                query_message['strategy'] = strategy
+            if use_cache:
+                for topic in missing:
+                    self._start_query(('topic', topic))
+            try:
+                response = self._index_request(self._watched(query_message), indexing_server_host, indexing_server_port)
+            finally:
+                cacheable = {topic for topic in missing if use_cache and self._finish_query(('topic', topic))}
+            for topic, result in zip(missing, response['results']):
+                if result['status'] == 'success':
+                    results[topic] = (result['peer_id'], tuple(result['peer_info']))
+                    if topic in cacheable:
+                        self.topic_cache.put(topic, (1, [results[topic]]))
+                else:
+                    results[topic] = None
+            return {topic: results[topic] for topic in topics}
+        except Exception as e:
+            print(f"Error querying topics: {e}")
+        return {topic: results.get(topic) for topic in topics}
+
+    def publish(self, topic, message, reliable=False):
+        """Publish a message to a topic.
+
+        A reliable publish carries a sequence number and is sent again until the
+        peer node acknowledges it (which needs the receive thread, started here
+        if necessary); the peer node handles retried copies only once. Returns
+        whether the message was sent, or for a reliable publish, acknowledged.
+        """
         if self.peer_host and self.peer_port:
             msg = {
                 'type': 'publish',
@@ -117,22 +417,72 @@ class ClientAPI:
                 'message': message
             }
             try:
-                self.client_socket.sendto(json.dumps(msg).encode(), (self.peer_host, self.peer_port))
+                if reliable:
+                    return self._publish_reliably(msg)
+                # Messages larger than one chunk are sent as several fragment datagrams
+                for datagram in fragment(encode_message(msg, self.wire_format)):
+                    self.client_socket.sendto(datagram, (self.peer_host, self.peer_port))
                 print(f"Sent publish request to {self.peer_host}:{self.peer_port}: {msg}")  # Log the sent message
+                return True
             except Exception as e:
                 print(f"Error sending publish request: {e}")
         else:
             print("Peer node is not selected.")
+        return False
 
-    def subscribe(self, topic):
-        """Subscribe to a topic."""
+    def _publish_reliably(self, msg):
+        if not self.receiving:
+            self.start_receiving()
+        seq = new_message_id()
+        acked = self.pending_publishes[seq] = threading.Event()
+        datagrams = fragment(encode_message(dict(msg, seq=seq), self.wire_format))
+        try:
+            for _ in range(PUBLISH_ATTEMPTS):
+                for datagram in datagrams:
+                    self.client_socket.sendto(datagram, (self.peer_host, self.peer_port))
+                if acked.wait(PUBLISH_ACK_TIMEOUT):
+                    return True
+            print(f"Publish to topic '{msg['topic']}' was not acknowledged after {PUBLISH_ATTEMPTS} attempts")
+            return False
+        finally:
+            del self.pending_publishes[seq]
+
+    def _send_to_peer(self, message):
+        self.client_socket.sendto(encode_message(message, self.wire_format), (self.peer_host, self.peer_port))
+
+    def subscribe(self, topic, offset=None, reliable=False):
+        """Subscribe to a topic.
+
+        With an offset, the peer node first replays the messages it still retains
+        from that offset on; a negative offset asks for that many recent messages.
+        Received messages carry their 'offset' so a client can resume after it.
+
+        topic may be a wildcard pattern (see query_matching) to receive every
+        matching topic; offsets and reliable delivery need an exact topic.
+
+        A reliable subscription receives every message exactly once and in offset
+        order: lost ones are asked for again and the peer node sends no faster than
+        this client acknowledges. Messages the peer node evicts before this client
+        catches up are skipped or end the subscription, per the node's policy.
+        """
         if self.peer_host and self.peer_port:
             msg = {
                 'type': 'subscribe',
                 'topic': topic
             }
+            if offset is not None:
+                msg['offset'] = offset
+            if reliable and is_pattern(topic):
+                print(f"Reliable delivery needs an exact topic; subscribing to '{topic}' without it")
+                reliable = False
+            if reliable:
+                if self.reliable is None:
+                    self.reliable = ReliableReceiver(self._send_to_peer, self.receive_window)
+                msg['reliable'] = True
+                msg['window'] = self.receive_window
+                self.reliable.open(topic, msg)
             try:
-                self.client_socket.sendto(json.dumps(msg).encode(), (self.peer_host, self.peer_port))
+                self.client_socket.sendto(encode_message(msg, self.wire_format), (self.peer_host, self.peer_port))
                 print(f"Sent subscribe request to {self.peer_host}:{self.peer_port}: {msg}")  # Log the sent message
             except Exception as e:
                 print(f"Error sending subscribe request: {e}")
@@ -140,15 +490,40 @@ class ClientAPI:
             print("Peer node is not selected.")
 
     def start_receiving(self):
+        self.receiving = True
         threading.Thread(target=self.receive_messages, daemon=True).start()
 
     def receive_messages(self):
+        buffer = bytearray(MAX_DATAGRAM_SIZE)  # Reused for every datagram
+        view = memoryview(buffer)
         while True:
             try:
-                data, _ = self.client_socket.recvfrom(1024)
-                message = json.loads(data.decode())
-                self.received_messages.append(message)
-                print(f"Received message: {message}")  # Log the received message
+                size, addr = self.client_socket.recvfrom_into(buffer)
+                data = self.reassembler.add(view[:size], addr)
+                if data is None:
+                    continue  # Waiting for the remaining fragments of a message
+                message = decode_message(data)
+                if message.get('type') == 'invalidate':
+                    self.handle_invalidation(message)  # Cache notice from the indexing server
+                    continue
+                if message.get('type') == 'ack':
+                    acked = self.pending_publishes.get(message.get('seq'))
+                    if acked is not None:
+                        acked.set()  # A reliable publish reached the peer node
+                    continue
+                if message.get('type') == 'gap':
+                    messages = self.reliable.gap(message) if self.reliable is not None else []
+                elif self.reliable is not None:
+                    messages = self.reliable.receive(message)  # In order and once for reliable topics
+                else:
+                    messages = [message]
+                for message in messages:
+                    self.received_messages.append(message)
+                    if self.message_handler is not None:
+                        self.message_handler(message)
+                    print(f"Received message: {message}")  # Log the received message
+            except ValueError as e:
+                print(f"Discarding malformed message: {e}")
             except Exception as e:
                 print(f"Error receiving message: {e}")
                 break
@@ -0,0 +1,180 @@
+import json
+import struct
+
+# Messages on the indexing server's TCP stream are newline-delimited JSON so
+# that a single connection can carry any number of requests back to back.
+FRAME_DELIMITER = b'\n'
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # Upper bound for a single framed message
+
+# Wire formats. JSON stays the default; the compact binary form is chosen per
+# connection or socket, and receivers detect it from the first byte of a message.
+JSON = 'json'
+BINARY = 'binary'
+WIRE_FORMATS = (JSON, BINARY)
+
+# Binary message layout: fixed header, then the topic, then the payload.
+#   magic (1) | type code (1) | flags (1) | topic length (2) | payload length (4)
+BINARY_MAGIC = 0xB7  # Never the first byte of a JSON document
+HEADER = struct.Struct('!BBBHI')
+FLAG_TOPIC = 0x01  # The header carries a topic
+FLAG_TEXT = 0x02  # The payload is the UTF-8 'message' string and nothing else
+FLAG_FIELDS = 0x04  # The payload is a JSON object holding the remaining fields
+
+# Type codes for the message kinds the components exchange. Anything else is
+# sent with code 0 and all of its fields in the JSON payload.
+GENERIC = 0
+MESSAGE_CODES = {
+    ('type', 'publish'): 1,
+    ('type', 'subscribe'): 2,
+    ('type', 'invalidate'): 3,
+    ('type', 'stats'): 4,
+    ('type', 'ack'): 5,
+    ('type', 'nack'): 6,
+    ('type', 'gap'): 7,
+    ('action', 'register'): 16,
+    ('action', 'unregister'): 17,
+    ('action', 'add_topic'): 18,
+    ('action', 'delete_topic'): 19,
+    ('action', 'query_topic'): 20,
+    ('action', 'get_peers'): 21,
+    ('action', 'register_topics'): 22,
+    ('action', 'delete_topics'): 23,
+    ('action', 'query_topics'): 24,
+    ('action', 'report_load'): 25,
+    ('action', 'heartbeat'): 26,
+    ('action', 'stats'): 27,
+    ('action', 'add_interest'): 28,
+    ('action', 'remove_interest'): 29,
+    ('action', 'query_interest'): 30,
+}
+MESSAGE_KINDS = {code: kind for kind, code in MESSAGE_CODES.items()}
+
+
+def encode_binary(message):
+    """Serialize a message dict into the compact binary format."""
+    key = 'type' if 'type' in message else 'action' if 'action' in message else None
+    code = MESSAGE_CODES.get((key, message.get(key)), GENERIC) if key else GENERIC
+    fields = {k: v for k, v in message.items() if not (code != GENERIC and k == key)}
+
+    flags = 0
+    topic = b''
+    if isinstance(fields.get('topic'), str):
+        topic = fields.pop('topic').encode('utf-8')
+        flags |= FLAG_TOPIC
+
+    if len(fields) == 1 and isinstance(fields.get('message'), str):
+        payload = fields['message'].encode('utf-8')
+        flags |= FLAG_TEXT
+    elif fields:
+        payload = json.dumps(fields, separators=(',', ':')).encode('utf-8')
+        flags |= FLAG_FIELDS
+    else:
+        payload = b''
+    return b''.join((HEADER.pack(BINARY_MAGIC, code, flags, len(topic), len(payload)), topic, payload))
+
+
+def decode_binary(data):
+    """Parse a message produced by encode_binary."""
+    magic, code, flags, topic_length, payload_length = HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary message")
+    if len(data) != HEADER.size + topic_length + payload_length:
+        raise ValueError("Binary message length does not match its header")
+
+    message = {}
+    if code != GENERIC:
+        key, name = MESSAGE_KINDS[code]
+        message[key] = name
+    offset = HEADER.size
+    if flags & FLAG_TOPIC:
+        message['topic'] = bytes(data[offset:offset + topic_length]).decode('utf-8')
+    offset += topic_length
+    payload = data[offset:offset + payload_length]
+    if flags & FLAG_TEXT:
+        message['message'] = bytes(payload).decode('utf-8')
+    elif flags & FLAG_FIELDS:
+        message.update(json.loads(bytes(payload)))
+    return message
+
+
+def detect_format(data):
+    """Return the wire format of an encoded message or frame."""
+    return BINARY if data and data[0] == BINARY_MAGIC else JSON
+
+
+def encode_message(message, wire_format=JSON):
+    """Serialize a datagram-sized message in the requested wire format."""
+    if wire_format == BINARY:
+        return encode_binary(message)
+    return json.dumps(message).encode()
+
+
+def decode_message(data):
+    """Parse a message in either wire format."""
+    if detect_format(data) == BINARY:
+        return decode_binary(data)
+    return json.loads(bytes(data))  # bytes() is a no-op for bytes and copies a memoryview
+
+
+def encode_frame(message, wire_format=JSON):
+    """Serialize a message as one stream frame.
+
+    JSON frames are newline-terminated; binary frames are delimited by the
+    lengths in their header.
+    """
+    if wire_format == BINARY:
+        return encode_binary(message)
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + FRAME_DELIMITER
+
+
+def send_frame(sock, message, wire_format=JSON):
+    """Send one framed message over a connected stream socket."""
+    sock.sendall(encode_frame(message, wire_format))
+
+
+def read_frame(stream):
+    """Read one frame from a buffered socket file.
+
+    Returns (message, wire_format), or (None, None) on EOF.
+    """
+    first = stream.read(1)
+    if not first:
+        return None, None
+    if first[0] == BINARY_MAGIC:
+        header = first + stream.read(HEADER.size - 1)
+        body = stream.read(binary_body_length(header))
+        return decode_binary(header + body), BINARY
+    frame = first + stream.readline(MAX_FRAME_SIZE)
+    if not frame.endswith(FRAME_DELIMITER):
+        raise ValueError("Frame exceeds maximum size or connection closed mid-frame")
+    return json.loads(frame), JSON
+
+
+def recv_frame(stream):
+    """Read one framed message from a buffered socket file; returns None on EOF."""
+    return read_frame(stream)[0]
+
+
+async def read_frame_async(reader):
+    """asyncio counterpart of read_frame for an asyncio.StreamReader."""
+    first = await reader.read(1)
+    if not first:
+        return None, None
+    if first[0] == BINARY_MAGIC:
+        header = first + await reader.readexactly(HEADER.size - 1)
+        body = await reader.readexactly(binary_body_length(header))
+        return decode_binary(header + body), BINARY
+    frame = first + await reader.readline()
+    if not frame.endswith(FRAME_DELIMITER):
+        raise ValueError("Frame exceeds maximum size or connection closed mid-frame")
+    return json.loads(frame), JSON
+
+
+def binary_body_length(header):
+    """Return the number of bytes following a complete binary header."""
+    if len(header) != HEADER.size:
+        raise ValueError("Connection closed mid-frame")
+    _, _, _, topic_length, payload_length = HEADER.unpack(header)
+    if topic_length + payload_length > MAX_FRAME_SIZE:
+        raise ValueError("Frame exceeds maximum size")
+    return topic_length + payload_length
@@ -0,0 +1,114 @@
+import os
+import socket
+import threading
+
+from codec import JSON, recv_frame, send_frame
+
+DEFAULT_POOL_SIZE = 4  # Connections kept open per indexing server
+DEFAULT_TIMEOUT = 5.0  # Seconds to wait on connect/send/receive
+
+
+class PooledConnection:
+    """A persistent framed connection to the indexing server."""
+
+    def __init__(self, address, timeout, wire_format=JSON):
+        self.wire_format = wire_format
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile('rb')
+
+    def request(self, message):
+        send_frame(self.sock, message, self.wire_format)
+        response = recv_frame(self.stream)
+        if response is None:
+            raise ConnectionError("Indexing server closed the connection")
+        return response
+
+    def close(self):
+        try:
+            self.stream.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of keepalive connections to one indexing server.
+
+    At most size connections are open at once; callers beyond that wait for a
+    connection to be returned. A request that fails on a reused connection (for
+    example because the server restarted) is retried once on a fresh one.
+    """
+
+    def __init__(self, address, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, wire_format=JSON):
+        self.address = address
+        self.size = size
+        self.timeout = timeout
+        self.wire_format = wire_format  # Encoding used for requests on every connection
+        self.idle = []  # Open connections not currently checked out
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def request(self, message):
+        """Send one request and return the server's response."""
+        with self.slots:
+            connection = self._checkout()
+            reused = connection is not None
+            try:
+                if connection is None:
+                    connection = PooledConnection(self.address, self.timeout, self.wire_format)
+                response = connection.request(message)
+            except (OSError, ValueError):
+                if connection is not None:
+                    connection.close()
+                if not reused:
+                    raise
+                # The idle connection went stale; reconnect and try once more
+                connection = PooledConnection(self.address, self.timeout, self.wire_format)
+                try:
+                    response = connection.request(message)
+                except (OSError, ValueError):
+                    connection.close()
+                    raise
+            with self.lock:
+                self.idle.append(connection)
+            return response
+
+    def _checkout(self):
+        with self.lock:
+            return self.idle.pop() if self.idle else None
+
+    def close(self):
+        """Close every idle connection."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _forget_pools_after_fork():
+    """Start a forked child without its parent's pools, whose sockets the two processes would otherwise share."""
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()  # The parent may have held it while forking
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+def get_pool(address, size=DEFAULT_POOL_SIZE, wire_format=JSON):
+    """Return the process-wide pool for address, size and wire format, creating it on first use.
+
+    Callers asking for different sizes get different pools, so a size is never silently ignored.
+    """
+    key = (tuple(address), size, wire_format)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key[0], size, wire_format=wire_format)
+        return pool
@@ -1,89 +1,337 @@
-import subprocess
-import time
-import random
+"""Load-generation benchmark for the P2P system.
+
+Starts an IndexingServer and N PeerNodes (as subprocesses, or in this process
+with --in-process), then drives concurrent ClientAPI clients with a weighted mix
+of register/add/query/publish/subscribe operations. Prints throughput and
+p50/p99/p999 latency per operation, plus end-to-end publish -> receive latency,
+as JSON that can be saved with --output and compared across commits.
+"""
+import argparse
+import contextlib
 import json
+import logging
+import os
+import random
+import shutil
 import socket
-import matplotlib.pyplot as plt
-
-# Constants
-INDEXING_SERVER_PORT = 9000
-PEER_PORTS = [8001, 8002, 8003, 8004, 8005, 8006, 8007, 8008]  # Extendable
-TOPIC_NAME = "Global Warming"
-NUMBER_OF_QUERIES = 1000  # Fixed number of requests per node
-TOPIC_COUNT = 1000000  # Number of topics in the indexing server
-
-def start_indexing_server():
-    """Starts the indexing server."""
-    print("Starting the indexing server...")
-    subprocess.Popen(["make", "indexing-server"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-def start_peer_nodes():
-    """Starts the peer nodes."""
-    print("Starting peer nodes...")
-    subprocess.Popen(["make", "peer-nodes"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-def measure_response_time(peer_node, topic):
-    """Measures the average response time for querying topics."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-        client_socket.connect(('127.0.0.1', INDEXING_SERVER_PORT))
-        total_time = 0
-        for _ in range(NUMBER_OF_QUERIES):
-            start_time = time.time()
-            request = {'action': 'get_topic', 'topic': topic}
-            client_socket.send(json.dumps(request).encode('utf-8'))
-            client_socket.recv(1024)  # Assume we wait for a response
-            total_time += time.time() - start_time
-        average_time = total_time / NUMBER_OF_QUERIES
-        return average_time
-
-def benchmark_api(peer_node):
-    """Benchmark the APIs for latency and throughput."""
-    print(f"Benchmarking APIs for peer node {peer_node}...")
-    latencies = []
-
-    for _ in range(3):  # Benchmarking each API 3 times
-        # Simulate API call with random latency
-        start_time = time.time()
-        time.sleep(random.uniform(0.01, 0.1))  # Simulated API latency
-        latencies.append(time.time() - start_time)
-
-    return latencies
-
-def plot_results(x_values, y_values, title, xlabel, ylabel):
-    """Plots the results."""
-    plt.plot(x_values, y_values)
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from client_api import ClientAPI
+from codec import JSON, WIRE_FORMATS
+from connection_pool import ConnectionPool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ('register', 'add', 'query', 'publish', 'subscribe')
+DEFAULT_MIX = 'register=1,add=5,query=60,publish=30,subscribe=4'
+STARTUP_TIMEOUT = 10.0  # Seconds to wait for the server and peers to come up
+DRAIN_TIME = 1.0  # Seconds to keep receiving after the last publish
+
+# Peer nodes run until terminated; PeerNode itself only starts daemon threads
+PEER_SCRIPT = ("import sys, threading; from peer_node import PeerNode; "
+               "PeerNode(port=int(sys.argv[1]), indexing_server_port=int(sys.argv[2])); threading.Event().wait()")
+
+
+def parse_mix(text):
+    """Parse 'query=60,publish=30,...' into {operation: weight}."""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (in milliseconds) of a list of latencies in seconds."""
+    ordered = sorted(latencies)
+    summary = {'count': len(ordered), 'throughput_per_s': round(len(ordered) / elapsed, 1) if elapsed else None}
+    for name, q in (('p50_ms', 0.50), ('p99_ms', 0.99), ('p999_ms', 0.999)):
+        value = percentile(ordered, q)
+        summary[name] = round(value * 1e3, 3) if value is not None else None
+    summary['mean_ms'] = round(sum(ordered) / len(ordered) * 1e3, 3) if ordered else None
+    summary['max_ms'] = round(ordered[-1] * 1e3, 3) if ordered else None
+    return summary
+
+
+def wait_for_port(port, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+class Cluster:
+    """An indexing server and peer nodes, run as subprocesses or inside this process."""
+
+    def __init__(self, server_port, peers, in_process=False):
+        self.server_port = server_port
+        self.peer_ports = [server_port + 1 + i for i in range(peers)]
+        self.in_process = in_process
+        self.processes = []
+        self.workdir = None  # Subprocesses run here so their log files stay out of the source tree
+        self.nodes = []  # In-process PeerNodes, kept alive for the run
+
+    def start(self):
+        if self.in_process:
+            from indexing_server import IndexingServer
+            from peer_node import PeerNode
+            logging.disable(logging.CRITICAL)  # Keep per-request logging out of the timings
+            server = IndexingServer('localhost', self.server_port)
+            threading.Thread(target=server.start_async, daemon=True).start()
+            wait_for_port(self.server_port)
+            for port in self.peer_ports:
+                self.nodes.append(PeerNode(port=port, indexing_server_port=self.server_port))
+        else:
+            self.workdir = tempfile.mkdtemp(prefix='p2p-bench-')
+            env = dict(os.environ, PYTHONPATH=HERE)
+            options = {'cwd': self.workdir, 'env': env, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+            self.processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(HERE, 'indexing_server.py'), '--port', str(self.server_port)], **options))
+            wait_for_port(self.server_port)
+            for port in self.peer_ports:
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, '-c', PEER_SCRIPT, str(port), str(self.server_port)], **options))
+
+    def wait_for_peers(self, client):
+        """Wait until every peer node has registered with the indexing server."""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            response = client._index_request({'action': 'get_peers'}, 'localhost', self.server_port)
+            registered = set(response.get('peers', {}))
+            if all(str(port) in registered for port in self.peer_ports):
+                return
+            time.sleep(0.1)
+        raise RuntimeError("Peer nodes did not register in time")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadClient:
+    """One ClientAPI driven by its own thread through a random operation mix."""
+
+    def __init__(self, index, api, server_port, topics, rng):
+        self.index = index
+        self.api = api
+        self.server_port = server_port
+        self.topics = topics  # Shared pool of existing topics used by query, publish and subscribe
+        self.rng = rng
+        self.peer_id = api.client_socket.getsockname()[1]
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.created = 0
+        self.published = 0
+
+    def register(self):
+        response = self.api._index_request({'action': 'register', 'peer_id': self.peer_id, 'peer_port': self.peer_id},
+                                           'localhost', self.server_port)
+        return response['status'] == 'success'
+
+    def add(self):
+        self.created += 1
+        return self.api.create_topic(f"bench-{self.index}-{self.created}", indexing_server_port=self.server_port)
+
+    def query(self):
+        return bool(self.api.query_topic(self.rng.choice(self.topics), indexing_server_port=self.server_port))
+
+    def publish(self, payload):
+        self.published += 1
+        # The send time travels in the message so receivers can measure end-to-end latency
+        self.api.publish(self.rng.choice(self.topics), f"{time.perf_counter():.9f}|{payload}")
+        return True
+
+    def subscribe(self):
+        self.api.subscribe(self.rng.choice(self.topics))
+        return True
+
+    def run(self, operations, weights, duration, payload, start_barrier):
+        start_barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = self.publish(payload) if operation == 'publish' else getattr(self, operation)()
+            except Exception:
+                ok = False
+            if ok:
+                self.latencies[operation].append(time.perf_counter() - started)
+            else:
+                self.errors[operation] += 1
+
+
+def run_benchmark(args):
+    cluster = Cluster(args.port, args.peers, args.in_process)
+    delivered = []  # Publish -> receive latencies in seconds, appended by receive threads
+    cache_size = args.cache_size
+
+    def on_message(message):
+        sent, _, _ = str(message.get('message', '')).partition('|')
+        try:
+            delivered.append(time.perf_counter() - float(sent))
+        except ValueError:
+            pass
+
+    quiet = open(os.devnull, 'w')
+    cluster.start()
+    try:
+        # Peer nodes and clients print every message; keep that off the terminal
+        with contextlib.redirect_stdout(quiet):
+            rng = random.Random(args.seed)
+            topics = [f"topic-{i}" for i in range(args.topics)]
+            clients = []
+            for index in range(args.clients):
+                # ClientAPI installs a SIGINT handler, so clients are built in the main thread. Each gets its
+                # own connection so that clients do not queue behind one another for a shared one.
+                index_pool = ConnectionPool(('localhost', args.port), 1, wire_format=args.wire_format)
+                api = ClientAPI(client_port=0, pool_size=1, wire_format=args.wire_format, cache_size=cache_size,
+                                index_pool=index_pool)
+                api.peer_host, api.peer_port = 'localhost', cluster.peer_ports[index % len(cluster.peer_ports)]
+                api.message_handler = on_message
+                api.start_receiving()
+                clients.append(LoadClient(index, api, args.port, topics, random.Random(rng.random())))
+            cluster.wait_for_peers(clients[0].api)
+
+            # Every client registers and takes a share of the topic pool, then subscribes to some topics
+            for client in clients:
+                client.register()
+            for index, client in enumerate(clients):
+                client.api.create_topics(topics[index::len(clients)], indexing_server_port=args.port)
+                for topic in client.rng.sample(topics, min(args.subscriptions, len(topics))):
+                    client.api.subscribe(topic)
+            time.sleep(0.2)  # Let the subscriptions reach the peers
+
+            operations = list(args.mix)
+            weights = [args.mix[operation] for operation in operations]
+            payload = 'x' * args.payload_size
+            barrier = threading.Barrier(len(clients) + 1)  # Clients start together with the clock
+            threads = [threading.Thread(target=client.run, args=(operations, weights, args.duration, payload, barrier))
+                       for client in clients]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            time.sleep(DRAIN_TIME)
+            # The server's own view of the run: per-action counters and latency histograms
+            server_stats = clients[0].api._index_request({'action': 'stats'}, 'localhost', args.port).get('stats')
+    finally:
+        cluster.stop()
+        quiet.close()
+
+    results = {
+        'config': {
+            'clients': args.clients, 'peers': args.peers, 'topics': args.topics, 'duration_s': args.duration,
+            'mix': args.mix, 'payload_size': args.payload_size, 'subscriptions': args.subscriptions,
+            'wire_format': args.wire_format, 'cache_size': cache_size,
+            'mode': 'in-process' if args.in_process else 'subprocess', 'seed': args.seed,
+        },
+        'commit': git_commit(),
+        'elapsed_s': round(elapsed, 3),
+        'operations': {},
+    }
+    total = 0
+    for operation in operations:
+        latencies = [latency for client in clients for latency in client.latencies[operation]]
+        summary = summarize(latencies, elapsed)
+        summary['errors'] = sum(client.errors[operation] for client in clients)
+        results['operations'][operation] = summary
+        total += len(latencies)
+    results['total_throughput_per_s'] = round(total / elapsed, 1)
+    results['publish_to_receive'] = summarize(delivered, elapsed)
+    results['publish_to_receive']['published'] = sum(client.published for client in clients)
+    results['server_stats'] = server_stats
+    return results, {'delivered': delivered, 'operations': {
+        operation: [latency for client in clients for latency in client.latencies[operation]] for operation in operations}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def plot_results(samples, path):
+    """Save latency CDFs of every operation and of publish -> receive to path (needs matplotlib)."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    series = dict(samples['operations'], publish_to_receive=samples['delivered'])
+    for name, latencies in series.items():
+        if latencies:
+            ordered = sorted(latency * 1e3 for latency in latencies)
+            plt.plot(ordered, [(i + 1) / len(ordered) for i in range(len(ordered))], label=name)
+    plt.xscale('log')
+    plt.xlabel('Latency (ms)')
+    plt.ylabel('Fraction of operations')
+    plt.title('Latency CDF')
     plt.grid()
-    plt.show()
+    plt.legend()
+    plt.savefig(path)
+
 
 def main():
-    start_indexing_server()
-    time.sleep(2)  # Wait for server to start
-    start_peer_nodes()
-    time.sleep(2)  # Wait for peers to start
-
-    # Measure response times for various peer nodes
-    response_times = []
-    for peer in PEER_PORTS:
-        avg_time = measure_response_time('127.0.0.1', peer)
-        response_times.append(avg_time)
-        print(f"Average response time for peer {peer}: {avg_time:.4f} seconds")
-
-    # Benchmark APIs
-    api_latencies = []
-    for peer in PEER_PORTS:
-        latencies = benchmark_api(peer)
-        api_latencies.append(latencies)
-        print(f"Latencies for peer {peer}: {latencies}")
-
-    # Plotting response times
-    plot_results(PEER_PORTS, response_times, "Average Response Time vs Peer Nodes", "Peer Nodes", "Response Time (seconds)")
-
-    # Plotting API latencies
-    for idx, latencies in enumerate(api_latencies):
-        plot_results([1, 2, 3], latencies, f"API Latencies for Peer {PEER_PORTS[idx]}", "API Calls", "Latency (seconds)")
-
-if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent ClientAPI clients, one thread each')
+    parser.add_argument('--peers', type=int, default=2, help='Peer nodes; clients are spread across them')
+    parser.add_argument('--topics', type=int, default=1000, help='Topics registered before the run')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of measured load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--payload-size', type=int, default=64, help='Bytes of padding in each published message')
+    parser.add_argument('--subscriptions', type=int, default=20, help='Topics each client subscribes to up front')
+    parser.add_argument('--wire-format', choices=WIRE_FORMATS, default=JSON)
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Client topic-resolution cache entries (0 sends every query to the server)')
+    parser.add_argument('--port', type=int, default=9100, help='Indexing server port; peers use the following ports')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run the server and peers in this process instead of as subprocesses')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--plot', help='Save latency CDFs to this image file (requires matplotlib)')
+    args = parser.parse_args()
+    if args.plot:
+        try:
+            import matplotlib
+        except ImportError:
+            parser.error('--plot requires matplotlib')
+
+    results, samples = run_benchmark(args)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.plot:
+        plot_results(samples, args.plot)
+
+
+if __name__ == '__main__':
     main()
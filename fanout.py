@@ -0,0 +1,65 @@
+import queue
+import threading
+
+DEFAULT_SENDERS = 2  # Sender threads, each draining its own fan-out queue
+DEFAULT_BATCH_SIZE = 256  # Subscribers handled per queued work item
+DEFAULT_QUEUE_SIZE = 10000  # Pending work items, across all senders, before new fan-outs are dropped
+
+
+class FanoutEngine:
+    """Delivers already-encoded datagrams to many subscribers off the receive thread.
+
+    submit() only snapshots the subscriber list and queues it in batches, so the
+    caller never waits on sendto(); a pool of sender threads does the sending.
+    Batch k of a subscriber list always goes to sender k modulo the number of
+    senders, and each sender sends in submission order. A topic's subscribers
+    keep their positions in its list, so each one is always served by the same
+    sender and never receives a later message before an earlier one. If a
+    sender's queue is full the batch is dropped and counted rather than blocking.
+    """
+
+    def __init__(self, sock, senders=DEFAULT_SENDERS, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+        self.socket = sock
+        self.batch_size = batch_size
+        self.queues = [queue.Queue(max(1, queue_size // senders)) for _ in range(senders)]  # One per sender
+        self.sent = 0  # Datagrams handed to the kernel
+        self.errors = 0  # Datagrams whose sendto() failed
+        self.dropped = 0  # Datagrams discarded because a queue was full
+        for work in self.queues:
+            threading.Thread(target=self.run_sender, args=(work,), daemon=True).start()
+
+    def submit(self, datagrams, subscribers):
+        """Queue datagrams (the fragments of one message) for delivery to every address in subscribers."""
+        subscribers = tuple(subscribers)
+        for index, start in enumerate(range(0, len(subscribers), self.batch_size)):
+            batch = subscribers[start:start + self.batch_size]
+            try:
+                self.queues[index % len(self.queues)].put_nowait((datagrams, batch))
+            except queue.Full:
+                self.dropped += len(batch) * len(datagrams)
+
+    def backlog(self):
+        """Work items waiting in all senders' queues."""
+        return sum(work.qsize() for work in self.queues)
+
+    def run_sender(self, work):
+        """Sender thread: send each message queued on work to its batch of subscribers, in order."""
+        sendto = self.socket.sendto
+        while True:
+            datagrams, batch = work.get()
+            sent = 0
+            for subscriber in batch:
+                try:
+                    for datagram in datagrams:
+                        sendto(datagram, subscriber)
+                        sent += 1
+                except OSError as e:
+                    self.errors += 1
+                    print(f"Error sending message to {subscriber}: {e}")
+            self.sent += sent
+            work.task_done()
+
+    def join(self):
+        """Block until every queued batch has been sent."""
+        for work in self.queues:
+            work.join()
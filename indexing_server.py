@@ -1,39 +1,165 @@
 import socket
 import threading
-import json
+import asyncio
+import argparse
 import logging
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import time
+
+from cache import DEFAULT_CACHE_TTL, MAX_CACHE_TTL
+from chunking import fragment
+from codec import MAX_FRAME_SIZE, encode_frame, encode_message, read_frame, read_frame_async, send_frame
+from lease import DEFAULT_LEASE_TIMEOUT, TimerWheel
+from metrics import DEFAULT_LOG_SAMPLE, Metrics, sampled_queue_logger
+from persistence import DEFAULT_SNAPSHOT_EVERY, WriteAheadLog
+from selection import POLICIES
+from topic_index import TopicIndex
+from topic_trie import TopicTrie, is_pattern, prefix_pattern, topic_matches, validate_pattern
 
 # Configure logging
 logging.basicConfig(filename='indexing_server.log', level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
 
+# Actions with their own metrics; anything else is counted as 'invalid'
+ACTIONS = {'register', 'unregister', 'add_topic', 'delete_topic', 'query_topic', 'register_topics', 'delete_topics',
+           'query_topics', 'heartbeat', 'report_load', 'get_peers', 'stats', 'add_interest', 'remove_interest',
+           'query_interest'}
+# Actions that change the registry; refused once the write-ahead log has failed
+MUTATING_ACTIONS = {'register', 'unregister', 'add_topic', 'delete_topic', 'register_topics', 'delete_topics',
+                    'add_interest', 'remove_interest'}
+WATCH_MARGIN = 1.0  # Seconds a watch outlives the client cache entry it protects
+DEFAULT_WATCH_TTL = DEFAULT_CACHE_TTL + WATCH_MARGIN  # Seconds a watch lasts when the query names no cache TTL
+
 class IndexingServer:
-    def __init__(self, host='localhost', port=9000):
+    def __init__(self, host='localhost', port=9000, backlog=1024, selection='first', data_dir=None,
+                 snapshot_every=DEFAULT_SNAPSHOT_EVERY, lease_timeout=DEFAULT_LEASE_TIMEOUT, log_sample=DEFAULT_LOG_SAMPLE,
+                 watch_ttl=DEFAULT_WATCH_TTL):
+        if selection not in POLICIES:
+            raise ValueError(f"Unknown selection policy '{selection}'")
         self.host = host
         self.port = port
+        self.backlog = backlog  # Pending-connection queue size for the listening socket
         self.peers = {}  # Tracks peer nodes by peer_id as {peer_id: (host, port)}
-        self.topics = {}  # Tracks topics by topic name as {topic: [peer_id1, peer_id2]}
+        self.topics = TopicIndex()  # Tracks which peers hold each topic, and each peer's topics
+        self.interests = TopicIndex()  # Peers with local subscribers per topic or pattern; publishes are forwarded to them
+        self.peer_load = {}  # Latest load report per peer as {peer_id: {'load', 'subscribers', 'reported_at'}}
+        self.policies = {name: policy() for name, policy in POLICIES.items()}
+        self.selection = selection  # Policy used when a query does not name one
+        self.lock = threading.Lock()  # Serializes access to the registry across connection threads
+        self.lease_timeout = lease_timeout  # Seconds without a heartbeat before a peer is dropped (None disables)
+        self.leases = TimerWheel(time.monotonic())  # Lease expiry time of every registered peer
+
+        # One-shot change notifications for client caches: a query may ask to be told (over UDP)
+        # when its answer is invalidated, and the watch is dropped once it fires. It is also dropped after
+        # the cache TTL the query names (capped at MAX_CACHE_TTL, watch_ttl if none) plus WATCH_MARGIN, when the
+        # watcher's cached answer has expired anyway, so departed clients leave nothing behind
+        self.topic_watches = {}  # {topic: {(host, udp_port)}}
+        self.pattern_watches = TopicTrie()  # {pattern: {(host, udp_port)}} for wildcard and prefix queries
+        self.peer_watches = set()  # Watchers of the peer list returned by get_peers
+        self.watch_ttl = watch_ttl
+        self.request_watch_ttl = watch_ttl  # Lapse of the watches added by the current request
+        self.watch_expiry = TimerWheel(time.monotonic())  # Lapse time of every watch, keyed by (kind, key, watcher)
+        self.pending_invalidations = {}  # {watcher: {'topics': [...], 'peers': bool}} for the current request
+        self.notify_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # Instrumentation: per-action counters and latency histograms, served by the 'stats' action.
+        # Per-request log records are sampled and written by a background thread (log_sample=0 disables them)
+        self.metrics = Metrics()
+        self.metrics.gauge('peers', lambda: len(self.peers))
+        self.metrics.gauge('topics', lambda: len(self.topics))
+        self.metrics.gauge('leases', lambda: len(self.leases))
+        self.metrics.gauge('watched_topics', lambda: len(self.topic_watches))
+        self.metrics.gauge('watched_patterns', lambda: len(self.pattern_watches))
+        self.metrics.gauge('wal_backlog', lambda: self.wal.appended - self.wal.durable if self.wal else 0)
+        self.request_log = sampled_queue_logger('indexing_server.requests', log_sample)
+
+        # Optional persistence: mutations are logged and the registry is rebuilt on restart
+        self.wal = None
+        self.snapshot_every = snapshot_every  # Logged mutations between compacted snapshots
+        self.snapshotting = False
+        self.pending_seq = 0  # Log sequence number of the request being processed, if it logged anything
+        if data_dir is not None:
+            self.wal = WriteAheadLog(data_dir)
+            self.recover()
+            self.wal.start()
 
     def handle_peer(self, peer_socket, addr):
         """Handle incoming peer connections and process their requests."""
         try:
-            logging.info(f"Peer connected from {addr}")
+            self.metrics.incr('connections_opened')
+            self.request_log.info("Peer connected from %s", addr)
+            stream = peer_socket.makefile('rb')
             while True:
-                request = peer_socket.recv(1024).decode('utf-8')
-                if not request:
+                request, wire_format = read_frame(stream)
+                if request is None:
                     break
-                request = json.loads(request)
-                logging.info(f"Received request: {request} from {addr}")
-                response = self.process_request(request, addr)
-                peer_socket.send(json.dumps(response).encode('utf-8'))
-                logging.info(f"Sent response: {response} to {addr}")
+                self.request_log.info("Received request: %s from %s", request, addr)
+                response, seq = self.execute_request(request, addr)
+                if seq:
+                    started = time.perf_counter()
+                    try:
+                        self.wal.wait_durable(seq)  # Acknowledge mutations only once they are on disk
+                    except Exception as e:
+                        response = self.not_durable(e)
+                    self.metrics.observe('durable_wait_ms', (time.perf_counter() - started) * 1e3)
+                send_frame(peer_socket, response, wire_format)  # Answer in the format the request used
+                self.request_log.info("Sent response: %s to %s", response, addr)
         except Exception as e:
             logging.error(f"Error handling peer {addr}: {e}")
         finally:
             peer_socket.close()
-            logging.info(f"Peer {addr} disconnected")
+            self.metrics.incr('connections_closed')
+            self.request_log.info("Peer %s disconnected", addr)
+
+    def not_durable(self, error):
+        """Response to a mutation that was applied but could not be written to the log."""
+        self.metrics.incr('errors.durability')
+        return {'status': 'error', 'message': f"Change not persisted, write-ahead log failed: {error}"}
 
     def process_request(self, request, addr):
+        """Apply one request and return its response."""
+        return self.execute_request(request, addr)[0]
+
+    def execute_request(self, request, addr):
+        """Apply one request; returns (response, seq).
+
+        seq is the log sequence number to wait for before acknowledging a
+        mutation, or 0 when nothing was logged.
+        """
+        started = time.perf_counter()
+        # Every request, including a whole batch, is applied under one lock acquisition
+        with self.lock:
+            self.pending_seq = 0
+            if self.wal is not None and self.wal.error is not None and request.get('action') in MUTATING_ACTIONS:
+                response = {'status': 'error',
+                            'message': f"Not accepting changes, write-ahead log failed: {self.wal.error}"}
+            else:
+                response = self.dispatch_request(request, addr)
+            seq = self.pending_seq
+            if self.pending_invalidations:
+                self.send_invalidations()
+            if self.wal is not None and self.wal.records_since_snapshot >= self.snapshot_every and not self.snapshotting:
+                self.start_snapshot()
+        # Latency includes time spent waiting for the lock, so contention shows up in the histograms
         action = request.get('action')
+        action = action if action in ACTIONS else 'invalid'
+        self.metrics.observe(f"latency_ms.{action}", (time.perf_counter() - started) * 1e3)
+        self.metrics.incr(f"requests.{action}")
+        if response['status'] != 'success':
+            self.metrics.incr(f"errors.{action}")
+        return response, seq
+
+    def dispatch_request(self, request, addr):
+        action = request.get('action')
+        watcher = (addr[0], request['watch']) if request.get('watch') else None  # UDP port for invalidations
+        cache_ttl = request.get('watch_ttl')  # How long the watcher will cache the answer
+        if isinstance(cache_ttl, (int, float)) and cache_ttl > 0:
+            self.request_watch_ttl = min(cache_ttl, MAX_CACHE_TTL) + WATCH_MARGIN
+        else:
+            self.request_watch_ttl = self.watch_ttl
 
         if action == 'register':
             return self.register_peer(request['peer_id'], addr[0], request['peer_port'])
@@ -44,81 +170,483 @@ class IndexingServer:
         elif action == 'delete_topic':
             return self.delete_topic(request['peer_id'], request['topic'])
         elif action == 'query_topic':
-            return self.query_topic(request['topic'])
+            return self.query_topic(request['topic'], request.get('strategy'), request.get('count'), watcher,
+                                    request.get('prefix', False))
+        elif action == 'register_topics':
+            return self.register_topics(request['peer_id'], request['topics'])
+        elif action == 'delete_topics':
+            return self.delete_topics(request['peer_id'], request['topics'])
+        elif action == 'query_topics':
+            return self.query_topics(request['topics'], request.get('strategy'), request.get('count'), watcher)
+        elif action == 'heartbeat':
+            return self.heartbeat(request['peer_id'])
+        elif action == 'report_load':
+            return self.report_load(request['peer_id'], request.get('load', 0), request.get('subscribers', 0))
         elif action == 'get_peers':
-            return self.get_peers()
+            return self.get_peers(watcher)
+        elif action == 'add_interest':
+            return self.add_interest(request['peer_id'], request['topic'])
+        elif action == 'remove_interest':
+            return self.remove_interest(request['peer_id'], request['topic'])
+        elif action == 'query_interest':
+            return self.query_interest(request['topic'], watcher)
+        elif action == 'stats':
+            return self.stats()
         else:
-            logging.warning(f"Invalid action received: {action}")
+            self.request_log.warning("Invalid action received: %s", action)
             return {'status': 'error', 'message': 'Invalid action'}
 
     def register_peer(self, peer_id, host, port):
         self.peers[peer_id] = (host, port)
+        self.renew_lease(peer_id)
+        self.record('register', peer_id, host, port)
+        self.invalidate_peers()
         logging.info(f"Registered peer {peer_id} at {host}:{port}")
-        return {'status': 'success', 'message': f"Peer {peer_id} registered"}
+        return {'status': 'success', 'message': f"Peer {peer_id} registered", 'lease': self.lease_timeout}
 
     def unregister_peer(self, peer_id):
         if peer_id in self.peers:
             del self.peers[peer_id]
+            self.peer_load.pop(peer_id, None)
+            self.leases.cancel(peer_id)
             # Remove peer from any topics it was associated with
-            for topic in list(self.topics.keys()):
-                if peer_id in self.topics[topic]:
-                    self.topics[topic].remove(peer_id)
-                    if not self.topics[topic]:
-                        del self.topics[topic]  # Remove topic if no peers hold it
+            for topic in self.topics.remove_peer(peer_id):
+                self.invalidate_topic(topic)
+            for topic in self.interests.remove_peer(peer_id):
+                self.invalidate_interest(topic)
+            self.record('unregister', peer_id)
+            self.invalidate_peers()
             logging.info(f"Unregistered peer {peer_id}")
             return {'status': 'success', 'message': f"Peer {peer_id} unregistered"}
         else:
             return {'status': 'error', 'message': f"Peer {peer_id} not found"}
 
     def add_topic(self, peer_id, topic):
+        if is_pattern(topic):
+            return {'status': 'error', 'message': f"Topic '{topic}' contains a wildcard level"}
         if peer_id in self.peers:
-            if topic not in self.topics:
-                self.topics[topic] = []
-            if peer_id not in self.topics[topic]:
-                self.topics[topic].append(peer_id)
-            logging.info(f"Peer {peer_id} added topic '{topic}'")
+            if self.topics.add(peer_id, topic):
+                self.record('add_topic', peer_id, topic)
+                self.invalidate_topic(topic)  # A new holder can change the chosen candidates
+            self.request_log.info("Peer %s added topic '%s'", peer_id, topic)
             return {'status': 'success', 'message': f"Topic '{topic}' added for peer {peer_id}"}
         else:
             return {'status': 'error', 'message': f"Peer {peer_id} not registered"}
 
     def delete_topic(self, peer_id, topic):
-        if topic in self.topics and peer_id in self.topics[topic]:
-            self.topics[topic].remove(peer_id)
-            if not self.topics[topic]:
-                del self.topics[topic]
-            logging.info(f"Peer {peer_id} deleted topic '{topic}'")
+        if self.topics.remove(peer_id, topic):
+            self.record('delete_topic', peer_id, topic)
+            self.invalidate_topic(topic)
+            self.request_log.info("Peer %s deleted topic '%s'", peer_id, topic)
             return {'status': 'success', 'message': f"Topic '{topic}' deleted for peer {peer_id}"}
         else:
             return {'status': 'error', 'message': f"Topic '{topic}' not found for peer {peer_id}"}
 
-    def query_topic(self, topic):
-        if topic in self.topics and self.topics[topic]:
-            peer_id = self.topics[topic][0]  # Return the first peer holding the topic
-            logging.info(f"Query for topic '{topic}' found peer {peer_id}")
-            return {'status': 'success', 'peer_id': peer_id, 'peer_info': self.peers[peer_id]}
+    def add_interest(self, peer_id, topic):
+        """Record that peer_id has local subscribers for topic, so other peers forward its publishes there.
+
+        topic may be a wildcard pattern, which covers every topic it matches.
+        """
+        try:
+            validate_pattern(topic)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        if peer_id in self.peers:
+            if self.interests.add(peer_id, topic):
+                self.record('add_interest', peer_id, topic)
+                self.invalidate_interest(topic)
+            return {'status': 'success', 'message': f"Peer {peer_id} interested in topic '{topic}'"}
+        else:
+            return {'status': 'error', 'message': f"Peer {peer_id} not registered"}
+
+    def remove_interest(self, peer_id, topic):
+        if self.interests.remove(peer_id, topic):
+            self.record('remove_interest', peer_id, topic)
+            self.invalidate_interest(topic)
+            return {'status': 'success', 'message': f"Peer {peer_id} no longer interested in topic '{topic}'"}
         else:
-            logging.warning(f"Query for topic '{topic}' failed")
+            return {'status': 'error', 'message': f"Peer {peer_id} not interested in topic '{topic}'"}
+
+    def query_interest(self, topic, watcher=None):
+        """Return the peers with subscribers for topic, directly or through a wildcard pattern (possibly none).
+
+        A watcher is notified once, like a topic query's, when the set changes.
+        """
+        if watcher is not None:
+            self.watch('topic', topic, watcher)
+        peers = [{'peer_id': p, 'peer_info': self.peers[p]} for p in self.interests.matching_holders(topic)]
+        return {'status': 'success', 'peers': peers}
+
+    def query_topic(self, topic, strategy=None, count=None, watcher=None, prefix=False):
+        """Resolve topic to a holding peer; with count, return up to count ranked candidates.
+
+        A wildcard pattern, or topic with prefix set (meaning topic and every
+        topic below it), is resolved to one holding peer per matching topic.
+        A watcher (host, udp_port) is notified once when this answer may no longer hold.
+        """
+        policy = self.policies.get(strategy or self.selection)
+        if policy is None:
+            return {'status': 'error', 'message': f"Unknown selection strategy '{strategy}'"}
+        if count is not None and (type(count) is not int or count < 1):
+            return {'status': 'error', 'message': f"Count must be a positive integer, got {count!r}"}
+        if prefix or is_pattern(topic):
+            return self.query_matching(prefix_pattern(topic) if prefix else topic, policy, watcher)
+        holders = self.topics.holders(topic)
+        if holders:
+            ranked = policy.rank(topic, holders, self.peer_load, count or 1)
+            peer_id = ranked[0]
+            self.request_log.info("Query for topic '%s' found peer %s", topic, peer_id)
+            response = {'status': 'success', 'peer_id': peer_id, 'peer_info': self.peers[peer_id]}
+            if count is not None:
+                response['peers'] = [{'peer_id': p, 'peer_info': self.peers[p]} for p in ranked]
+            if watcher is not None:
+                self.watch('topic', topic, watcher)
+            return response
+        else:
+            self.request_log.warning("Query for topic '%s' failed", topic)
             return {'status': 'error', 'message': f"Topic '{topic}' not found"}
 
-    def get_peers(self):
+    def query_matching(self, pattern, policy, watcher=None):
+        """Resolve every topic matching a wildcard pattern to one holding peer."""
+        try:
+            validate_pattern(pattern)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        results = []
+        for topic, holders in self.topics.matching_topics(pattern):
+            peer_id = policy.rank(topic, holders, self.peer_load, 1)[0]
+            results.append({'topic': topic, 'peer_id': peer_id, 'peer_info': self.peers[peer_id]})
+        if watcher is not None:
+            self.watch('pattern', pattern, watcher)  # Also told about topics added later
+        self.request_log.info("Query for pattern '%s' found %s topics", pattern, len(results))
+        return {'status': 'success', 'pattern': pattern, 'topics': results}
+
+    def report_load(self, peer_id, load, subscribers):
+        """Record the current message rate and subscriber count reported by a peer."""
+        if peer_id in self.peers:
+            self.peer_load[peer_id] = {'load': load, 'subscribers': subscribers, 'reported_at': time.monotonic()}
+            self.renew_lease(peer_id)  # A load report also proves the peer is alive
+            return {'status': 'success', 'message': f"Load recorded for peer {peer_id}"}
+        else:
+            return {'status': 'error', 'message': f"Peer {peer_id} not registered"}
+
+    def register_topics(self, peer_id, topics):
+        """Batch form of add_topic; returns one result per topic."""
+        if peer_id not in self.peers:
+            return {'status': 'error', 'message': f"Peer {peer_id} not registered"}
+        return {'status': 'success', 'results': [self.add_topic(peer_id, topic) for topic in topics]}
+
+    def delete_topics(self, peer_id, topics):
+        """Batch form of delete_topic; returns one result per topic."""
+        return {'status': 'success', 'results': [self.delete_topic(peer_id, topic) for topic in topics]}
+
+    def query_topics(self, topics, strategy=None, count=None, watcher=None):
+        """Batch form of query_topic; returns one result per topic."""
+        return {'status': 'success', 'results': [self.query_topic(topic, strategy, count, watcher) for topic in topics]}
+
+    def get_peers(self, watcher=None):
+        if watcher is not None:
+            self.watch('peers', None, watcher)
         if self.peers:
-            return {'status': 'success', 'peers': self.peers}
+            return {'status': 'success', 'peers': dict(self.peers)}  # Snapshot; encoded after the lock is released
         else:
-            logging.warning(f"No peers registered")
+            self.request_log.warning("No peers registered")
             return {'status': 'error', 'message': 'No peers registered'}
 
+    def stats(self):
+        """Return the server's counters, latency histograms and gauges."""
+        return {'status': 'success', 'stats': self.metrics.snapshot()}
+
+    def watch(self, kind, key, watcher):
+        """Add a watch of kind 'topic', 'pattern' or 'peers' (key None), or extend an existing one."""
+        if kind == 'peers':
+            self.peer_watches.add(watcher)
+        elif kind == 'topic':
+            self.topic_watches.setdefault(key, set()).add(watcher)
+        else:
+            self.pattern_watches.setdefault(key, set()).add(watcher)
+        self.watch_expiry.schedule((kind, key, watcher), time.monotonic() + self.request_watch_ttl)
+
+    def expire_watches(self):
+        """Drop the watches that have lapsed without firing."""
+        with self.lock:
+            for kind, key, watcher in self.watch_expiry.advance(time.monotonic()):
+                if kind == 'peers':
+                    self.peer_watches.discard(watcher)
+                    continue
+                watches = self.topic_watches if kind == 'topic' else self.pattern_watches
+                watchers = watches.get(key)
+                if watchers is not None:  # Already gone if the watch fired
+                    watchers.discard(watcher)
+                    if not watchers:
+                        watches.pop(key)
+
+    def invalidate_topic(self, topic):
+        """Queue a notification for everyone watching topic or a pattern matching it; each watch fires once."""
+        for watcher in self.topic_watches.pop(topic, ()):
+            self.pending_invalidations.setdefault(watcher, {'topics': [], 'peers': False})['topics'].append(topic)
+        if not self.pattern_watches:
+            return
+        for pattern, watchers in list(self.pattern_watches.match(topic)):
+            self.pattern_watches.pop(pattern)
+            for watcher in watchers:
+                self.pending_invalidations.setdefault(watcher, {'topics': [], 'peers': False})['topics'].append(pattern)
+
+    def invalidate_interest(self, topic):
+        """Invalidate the interest queries a change to the interest in topic (or a pattern) affects."""
+        if is_pattern(topic):
+            # Rare next to publishes, so scanning the watched topics is cheaper than indexing them by pattern
+            for watched in [watched for watched in self.topic_watches if topic_matches(topic, watched)]:
+                self.invalidate_topic(watched)
+        else:
+            self.invalidate_topic(topic)
+
+    def invalidate_peers(self):
+        """Queue a notification for everyone watching the peer list."""
+        for watcher in self.peer_watches:
+            self.pending_invalidations.setdefault(watcher, {'topics': [], 'peers': False})['peers'] = True
+        self.peer_watches.clear()
+
+    def send_invalidations(self):
+        """Send one invalidation message per watcher for the changes made by the current request."""
+        pending, self.pending_invalidations = self.pending_invalidations, {}
+        for watcher, change in pending.items():
+            message = {'type': 'invalidate', 'topics': change['topics'], 'peers': change['peers']}
+            try:
+                for datagram in fragment(encode_message(message)):
+                    self.notify_socket.sendto(datagram, watcher)
+                self.metrics.incr('invalidations_sent')
+            except OSError as e:
+                logging.warning(f"Could not notify {watcher} of invalidation: {e}")
+
+    def heartbeat(self, peer_id):
+        """Extend the lease of a registered peer; an error tells the peer to register again."""
+        if peer_id in self.peers:
+            self.renew_lease(peer_id)
+            return {'status': 'success', 'lease': self.lease_timeout}
+        else:
+            return {'status': 'error', 'message': f"Peer {peer_id} not registered"}
+
+    def renew_lease(self, peer_id):
+        if self.lease_timeout is not None:
+            self.leases.schedule(peer_id, time.monotonic() + self.lease_timeout)
+
+    def expire_leases(self):
+        """Unregister every peer whose lease has run out, cleaning up its topics through the index."""
+        with self.lock:
+            for peer_id in self.leases.advance(time.monotonic()):
+                logging.warning(f"Lease of peer {peer_id} expired")
+                self.unregister_peer(peer_id)
+            if self.pending_invalidations:
+                self.send_invalidations()
+
+    def expire_leases_periodically(self):
+        """Lease- and watch-expiry thread for the threaded server."""
+        while True:
+            time.sleep(self.leases.tick)
+            self.expire_leases()
+            self.expire_watches()
+
+    async def expire_leases_async(self):
+        """Lease- and watch-expiry task for the asyncio server."""
+        while True:
+            await asyncio.sleep(self.leases.tick)
+            self.expire_leases()
+            self.expire_watches()
+
+    def record(self, *record):
+        """Append a registry mutation to the write-ahead log, if persistence is enabled."""
+        if self.wal is not None:
+            self.pending_seq = self.wal.append(record)
+
+    def apply_record(self, record):
+        """Replay one logged mutation directly onto the registry."""
+        action = record[0]
+        if action == 'register':
+            self.peers[record[1]] = (record[2], record[3])
+        elif action == 'unregister':
+            self.peers.pop(record[1], None)
+            self.topics.remove_peer(record[1])
+            self.interests.remove_peer(record[1])
+        elif action == 'add_topic':
+            self.topics.add(record[1], record[2])
+        elif action == 'delete_topic':
+            self.topics.remove(record[1], record[2])
+        elif action == 'add_interest':
+            self.interests.add(record[1], record[2])
+        elif action == 'remove_interest':
+            self.interests.remove(record[1], record[2])
+
+    def recover(self):
+        """Rebuild the registry from the latest snapshot plus the log written after it."""
+        started = time.perf_counter()
+        rows, records = self.wal.load()
+        for peer_id, host, port, topics, *interests in rows:
+            self.peers[peer_id] = (host, port)
+            for topic in topics:
+                self.topics.add(peer_id, topic)
+            for topic in interests[0] if interests else ():  # Snapshots written before interests have no column
+                self.interests.add(peer_id, topic)
+        replayed = 0
+        for record in records:
+            self.apply_record(record)
+            replayed += 1
+        for peer_id in self.peers:
+            self.renew_lease(peer_id)  # Recovered peers get a fresh lease to reconnect and heartbeat
+        logging.info(f"Recovered {len(self.peers)} peers and {len(self.topics)} topics "
+                     f"({replayed} log records) in {time.perf_counter() - started:.2f}s")
+
+    def snapshot_rows(self):
+        return [[peer_id, host, port, list(self.topics.topics_of(peer_id)), list(self.interests.topics_of(peer_id))]
+                for peer_id, (host, port) in self.peers.items()]
+
+    def start_snapshot(self):
+        """Capture the registry and write it out as a snapshot in the background (call with the lock held)."""
+        self.snapshotting = True
+        segment = self.wal.rotate()
+        rows = self.snapshot_rows()
+
+        def write():
+            try:
+                self.wal.write_snapshot(segment, rows)
+                logging.info(f"Wrote snapshot of {len(rows)} peers covering log segments before {segment}")
+            except OSError as e:
+                logging.error(f"Error writing snapshot: {e}")
+            finally:
+                self.snapshotting = False
+        threading.Thread(target=write, daemon=True).start()
+
+    def snapshot(self):
+        """Write a compacted snapshot now and drop the log segments it replaces."""
+        with self.lock:
+            segment = self.wal.rotate()
+            rows = self.snapshot_rows()
+        self.wal.write_snapshot(segment, rows)
+
     def start(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
+        server_socket.listen(self.backlog)
         logging.info(f"Indexing server listening on {self.host}:{self.port}")
+        threading.Thread(target=self.expire_leases_periodically, daemon=True).start()
 
         while True:
             peer_socket, addr = server_socket.accept()
             peer_handler = threading.Thread(target=self.handle_peer, args=(peer_socket, addr))
             peer_handler.start()
 
+    async def handle_peer_async(self, reader, writer):
+        """Serve one connection on the event loop; pipelined requests are answered in order."""
+        addr = writer.get_extra_info('peername')
+        try:
+            self.metrics.incr('connections_opened')
+            self.request_log.info("Peer connected from %s", addr)
+            while True:
+                request, wire_format = await read_frame_async(reader)
+                if request is None:
+                    break
+                self.request_log.info("Received request: %s from %s", request, addr)
+                response, seq = self.execute_request(request, addr)
+                if seq:
+                    started = time.perf_counter()
+                    try:
+                        await self.wal.wait_durable_async(seq, asyncio.get_running_loop())
+                    except Exception as e:
+                        response = self.not_durable(e)
+                    self.metrics.observe('durable_wait_ms', (time.perf_counter() - started) * 1e3)
+                writer.write(encode_frame(response, wire_format))  # Answer in the format the request used
+                self.request_log.info("Sent response: %s to %s", response, addr)
+                await writer.drain()  # Returns immediately unless the peer stops reading
+        except Exception as e:
+            logging.error(f"Error handling peer {addr}: {e}")
+        finally:
+            writer.close()
+            self.metrics.incr('connections_closed')
+            self.request_log.info("Peer %s disconnected", addr)
+
+    async def serve_async(self):
+        """Run the indexing server on the current asyncio event loop."""
+        server = await asyncio.start_server(
+            self.handle_peer_async, self.host, self.port,
+            limit=MAX_FRAME_SIZE, backlog=self.backlog, reuse_address=True)
+        logging.info(f"Indexing server (asyncio) listening on {self.host}:{self.port}")
+        expiry = asyncio.create_task(self.expire_leases_async())  # Keep a reference so the task is not collected
+        async with server:
+            await server.serve_forever()
+
+    def start_async(self):
+        """Serve all connections from a single asyncio event loop instead of a thread per peer."""
+        raise_file_descriptor_limit()
+        asyncio.run(self.serve_async())
+
+
+def raise_file_descriptor_limit():
+    """Lift the soft open-file limit to the hard limit so many connections can be held open."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            logging.warning(f"Could not raise open file limit: {e}")
+
+
+def serve_shard(host, port, selection, threaded, data_dir=None, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                log_sample=DEFAULT_LOG_SAMPLE):
+    """Entry point of one shard process."""
+    indexing_server = IndexingServer(host, port, selection=selection, data_dir=data_dir, lease_timeout=lease_timeout,
+                                     log_sample=log_sample)
+    if threaded:
+        indexing_server.start()
+    else:
+        indexing_server.start_async()
+
+
+def run_shards(host, base_port, count, selection='first', threaded=False, data_dir=None,
+               lease_timeout=DEFAULT_LEASE_TIMEOUT, log_sample=DEFAULT_LOG_SAMPLE):
+    """Run count IndexingServer processes on consecutive ports starting at base_port.
+
+    Clients and peer nodes given the same list of addresses (index_shards) route
+    each topic to its owner on a consistent-hash ring.
+    """
+    shards = [(host, base_port + i) for i in range(count)]
+    processes = [multiprocessing.Process(target=serve_shard, args=(
+                     shard_host, shard_port, selection, threaded,
+                     os.path.join(data_dir, f"shard-{i}") if data_dir else None, lease_timeout, log_sample))
+                 for i, (shard_host, shard_port) in enumerate(shards)]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {count} indexing server shards: {shards}")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Stop the shards along with this process
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
 if __name__ == '__main__':
-    indexing_server = IndexingServer('localhost', 9000)
-    indexing_server.start()
+    parser = argparse.ArgumentParser(description='Run the P2P indexing server.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--selection', default='first', choices=sorted(POLICIES),
+                        help='Default policy for choosing among the peers holding a topic')
+    parser.add_argument('--threaded', action='store_true',
+                        help='Use one thread per connection instead of the asyncio event loop')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_TIMEOUT,
+                        help='Seconds a peer stays registered without sending a heartbeat (0 disables leases)')
+    parser.add_argument('--data-dir',
+                        help='Persist the registry here (write-ahead log plus snapshots) and recover it on start')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Run this many shard processes on consecutive ports starting at --port')
+    parser.add_argument('--log-sample', type=int, default=DEFAULT_LOG_SAMPLE,
+                        help='Log one in this many per-request records (0 disables per-request logging)')
+    args = parser.parse_args()
+    args.lease = args.lease or None
+
+    if args.shards > 1:
+        run_shards(args.host, args.port, args.shards, args.selection, args.threaded, args.data_dir, args.lease,
+                   args.log_sample)
+    else:
+        serve_shard(args.host, args.port, args.selection, args.threaded, args.data_dir, args.lease, args.log_sample)
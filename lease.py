@@ -0,0 +1,49 @@
+DEFAULT_LEASE_TIMEOUT = 30.0  # Seconds a peer stays registered without a heartbeat
+DEFAULT_TICK = 1.0  # Expiry resolution of the timer wheel in seconds
+DEFAULT_SLOTS = 512  # Wheel size; leases longer than slots * tick simply wait extra rotations
+
+
+class TimerWheel:
+    """Hashed timer wheel keyed by an arbitrary id.
+
+    schedule() and cancel() are O(1); advance() visits only the slots whose time
+    has come, so expiring timers costs O(ticks elapsed + timers in those slots)
+    rather than a scan of every live timer.
+    """
+
+    def __init__(self, now, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # Each slot maps key -> deadline
+        self.location = {}  # {key: slot index}
+        self.current = int(now // tick)  # Last tick already processed
+
+    def __len__(self):
+        return len(self.location)
+
+    def schedule(self, key, deadline):
+        """Set (or move) the timer for key to fire at deadline."""
+        self.cancel(key)
+        tick = max(int(deadline // self.tick), self.current + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = deadline
+        self.location[key] = slot
+
+    def cancel(self, key):
+        slot = self.location.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now):
+        """Move the wheel forward to now and return the keys whose deadline has passed."""
+        target = int(now // self.tick)
+        steps = min(target - self.current, len(self.slots))
+        expired = []
+        for tick in range(target - steps + 1, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            due = [key for key, deadline in bucket.items() if deadline <= now]
+            for key in due:
+                del bucket[key]
+                del self.location[key]
+            expired.extend(due)
+        self.current = max(self.current, target)
+        return expired
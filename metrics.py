@@ -0,0 +1,152 @@
+import logging
+import logging.handlers
+import math
+import queue
+import threading
+import time
+
+DEFAULT_LOG_SAMPLE = 100  # Per-request log records kept: one in this many (0 switches them off)
+HISTOGRAM_PRECISION = 8  # Buckets per doubling, so reported percentiles are within about 9%
+HISTOGRAM_UNIT = 1e-3  # Smallest value told apart; latencies are recorded in milliseconds (1 microsecond resolution)
+PERCENTILES = (('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('p999', 0.999))
+
+
+class Histogram:
+    """Fixed-resolution histogram with logarithmic buckets.
+
+    record() is O(1) and memory grows only with the range of values seen, not
+    their number; percentiles are read from the bucket upper bounds.
+    """
+
+    def __init__(self, unit=HISTOGRAM_UNIT, precision=HISTOGRAM_PRECISION):
+        self.unit = unit
+        self.precision = precision
+        self.buckets = {}  # {bucket index: count}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        index = int(math.log2(value / self.unit) * self.precision) + 1 if value > self.unit else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def bound(self, index):
+        """Upper bound of the values in a bucket."""
+        return self.unit * 2 ** (index / self.precision)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.bound(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        summary = {'count': self.count, 'mean': self.total / self.count if self.count else None, 'max': self.max}
+        for name, q in PERCENTILES:
+            summary[name] = self.percentile(q)
+        return summary
+
+
+class Metrics:
+    """Thread-safe counters and histograms plus gauges read on demand.
+
+    Recording costs one uncontended lock acquisition; gauges are callables
+    evaluated only when a snapshot is taken, so queue depths and table sizes
+    cost nothing on the hot path.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}  # {name: callable returning the current value}
+        self.started = time.monotonic()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        """Record value (a latency in milliseconds, a size, ...) in the histogram called name."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(value)
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def snapshot(self):
+        """Return every metric as a JSON-serializable dict."""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+        gauges = {}
+        for name, function in self.gauges.items():
+            try:
+                gauges[name] = function()
+            except Exception as e:  # A gauge racing a mutation must not break the stats reply
+                gauges[name] = f"unavailable: {e}"
+        return {'uptime': time.monotonic() - self.started, 'counters': counters,
+                'histograms': histograms, 'gauges': gauges}
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Passes one in every sample_every records below ERROR (all of them at ERROR and above).
+
+    The sample is taken in isEnabledFor, before a LogRecord is built, so a record
+    that is sampled out costs a counter increment.
+    """
+
+    def __init__(self, logger, sample_every):
+        super().__init__(logger, {})
+        self.sample_every = sample_every
+        self.seen = 0
+
+    def isEnabledFor(self, level):
+        if level < logging.ERROR:
+            if not self.sample_every:
+                return False
+            self.seen += 1
+            if self.seen % self.sample_every:
+                return False
+        return self.logger.isEnabledFor(level)
+
+
+_sampled_loggers = {}  # {name: SampledLogger}
+
+
+def sampled_queue_logger(name, sample_every=DEFAULT_LOG_SAMPLE, handlers=None):
+    """Return a sampling adapter for the logger called name, set up for high-volume per-request records.
+
+    Records are sampled (one in sample_every; 0 switches the logger off) and
+    handed through a queue to a background thread that writes them to handlers
+    (the root logger's handlers by default), so callers never wait on I/O.
+    Unsampled records are never formatted: log with %-style arguments.
+    Calling this again for the same name only changes the sample rate.
+    """
+    logger = logging.getLogger(name)
+    sampled = _sampled_loggers.get(name)
+    if sampled is not None:
+        sampled.sample_every = sample_every
+    else:
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.propagate = False  # The listener below writes to the real handlers
+        listener = logging.handlers.QueueListener(records, *(handlers or logging.getLogger().handlers),
+                                                  respect_handler_level=True)
+        listener.start()
+        sampled = _sampled_loggers[name] = SampledLogger(logger, sample_every)
+    logger.setLevel(logging.INFO)
+    logger.disabled = not sample_every
+    return sampled
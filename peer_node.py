@@ -1,22 +1,114 @@
+import collections
+import logging
+import queue
 import socket
 import threading
-import json
 import random
 import signal
 import sys
+import time
+
+from cache import DEFAULT_CACHE_TTL, TTLCache
+from chunking import MAX_DATAGRAM_SIZE, Reassembler, fragment, new_message_id
+from codec import BINARY, JSON, decode_message, detect_format, encode_message
+from connection_pool import DEFAULT_POOL_SIZE, get_pool
+from fanout import DEFAULT_SENDERS, FanoutEngine
+from metrics import DEFAULT_LOG_SAMPLE, Metrics, sampled_queue_logger
+from reliable import DEFAULT_SLOW_POLICY, ReliableSender
+from retention import (DEFAULT_RETENTION_BYTES, DEFAULT_RETENTION_MESSAGES, DEFAULT_RETENTION_TOTAL_BYTES,
+                       ReplayScheduler, RetentionStore)
+from shard_ring import ShardRouter
+from topic_trie import TopicTrie, is_pattern, validate_pattern
+
+LOAD_REPORT_INTERVAL = 5  # Seconds between load reports sent to the indexing server
+HEARTBEATS_PER_LEASE = 3  # Heartbeats sent within each lease period, so one lost heartbeat is harmless
+DEFAULT_HEARTBEAT_INTERVAL = 10  # Used until the indexing server reports its lease length
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # Requested kernel buffer size so fragment bursts are not dropped
+DEDUP_WINDOW = 65536  # Forwarded message ids remembered for duplicate suppression
+INTEREST_RETRY = 1.0  # Seconds a failed interest lookup is remembered before the indexing server is asked again
+MAX_PENDING_FORWARDS = 1024  # Publishes per topic held while the topic's interested peers are looked up
+MESSAGE_TYPES = {'publish', 'subscribe', 'stats', 'invalidate', 'ack', 'nack'}  # Message types with their own metrics
 
 class PeerNode:
-    def __init__(self, host='localhost', port=None, indexing_server_host='localhost', indexing_server_port=9000):
+    def __init__(self, host='localhost', port=None, indexing_server_host='localhost', indexing_server_port=9000,
+                 pool_size=DEFAULT_POOL_SIZE, senders=DEFAULT_SENDERS, wire_format=JSON, index_shards=None,
+                 log_sample=DEFAULT_LOG_SAMPLE, retention=False, retention_messages=DEFAULT_RETENTION_MESSAGES,
+                 retention_bytes=DEFAULT_RETENTION_BYTES, retention_total_bytes=DEFAULT_RETENTION_TOTAL_BYTES,
+                 reuse_port=False, slow_policy=DEFAULT_SLOW_POLICY):
         self.host = host
         self.port = port if port is not None else random.randint(5000, 6000)
         self.indexing_server = (indexing_server_host, indexing_server_port)  # Indexing server address
-        self.subscribers = {}  # Dictionary to store subscribers by topic
+        self.wire_format = wire_format  # Encoding for index requests and forwarded publishes
+        if index_shards:
+            # Sharded indexing tier: requests are routed to the shard owning each topic
+            self.index_pool = ShardRouter(index_shards, pool_size, wire_format)
+        else:
+            self.index_pool = get_pool(self.indexing_server, pool_size, wire_format)  # Persistent connections to the indexing server
+        self.subscribers = {}  # Subscribers by topic as {topic: {addr: wire_format}}, kept in subscription order
+        self.patterns = TopicTrie()  # Wildcard subscriptions as {pattern: {addr: wire_format}}, matched by topic level
+        self.published_count = 0  # Publishes handled; written only by the thread handling messages
+        self.reported_count = 0  # published_count at the last load report
+        self.heartbeat_interval = DEFAULT_HEARTBEAT_INTERVAL  # Derived from the lease granted at registration
+
+        # Overlay routing: publishes are forwarded once to each other peer node with subscribers for the
+        # topic. Those peers are looked up on the indexing server and cached until it pushes an invalidation
+        self.interest_cache = TTLCache(ttl=DEFAULT_CACHE_TTL)  # {topic: [(host, port) of interested peers]}
+        self.seen_messages = collections.OrderedDict()  # (origin, id) of recently forwarded publishes, oldest first
+        # Lookups and interest announcements are made by a background thread so that listen never waits on
+        # the indexing server; publishes missing the cache wait for their lookup, failed lookups are remembered
+        self.index_requests = queue.Queue()  # (function, topic) calls to make against the indexing server
+        self.pending_forwards = {}  # {topic: [publish]} awaiting the lookup of the topic's interested peers
+        self.stale_lookups = set()  # Topics invalidated while their lookup was in flight
+        self.forward_lock = threading.Lock()
+        self.failed_lookups = TTLCache(ttl=INTEREST_RETRY)  # {topic: True} whose last lookup failed
 
         # Set up a UDP socket and bind to the provided host and port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # Worker processes share the port
         self.socket.bind((self.host, self.port))
+        self.reassembler = Reassembler()  # Rebuilds publishes that arrive as several fragments
         print(f"Node started at {self.host}:{self.port}")
 
+        # Publishes are fanned out by sender threads so the listen loop never waits on sendto()
+        self.fanout = FanoutEngine(self.socket, senders)
+
+        # With retention, recent messages of each topic are retained with per-topic offsets so a subscriber
+        # can ask to start from an earlier offset; the backlog is replayed in paced batches. It is opt-in:
+        # every publish is then encoded and copied once more, and memory is held up to retention_total_bytes
+        self.retention = None
+        self.replayer = None
+        # Reliable subscribers are served from the same buffer, offsets doubling as sequence numbers, with
+        # acks, retransmission and per-subscriber windows; slow_policy handles those that fall behind it
+        self.reliable = None
+        if retention and retention_messages:
+            self.retention = RetentionStore(retention_messages, retention_bytes, retention_total_bytes)
+            self.replayer = ReplayScheduler(self.retention, self.send_replay)
+            self.reliable = ReliableSender(self.retention, self.send_replay, self.send_notice, slow_policy)
+
+        # Instrumentation, answered to a 'stats' message; per-message output is sampled and printed
+        # by a background thread (log_sample=0 disables it)
+        self.metrics = Metrics()
+        self.metrics.gauge('topics', lambda: len(self.subscribers))
+        self.metrics.gauge('subscriptions', lambda: sum(len(subscribers) for subscribers in self.subscribers.values()))
+        self.metrics.gauge('patterns', lambda: len(self.patterns))
+        self.metrics.gauge('fanout_queue', self.fanout.backlog)
+        self.metrics.gauge('fanout_sent', lambda: self.fanout.sent)
+        self.metrics.gauge('fanout_errors', lambda: self.fanout.errors)
+        self.metrics.gauge('fanout_dropped', lambda: self.fanout.dropped)
+        self.metrics.gauge('reassembly_pending', lambda: len(self.reassembler.pending))
+        self.metrics.gauge('reassembly_dropped', lambda: self.reassembler.dropped)
+        self.metrics.gauge('interest_cache', self.interest_cache.stats)
+        self.metrics.gauge('index_requests', self.index_requests.qsize)
+        self.metrics.gauge('pending_forwards', lambda: sum(map(len, list(self.pending_forwards.values()))))
+        if self.retention is not None:
+            self.metrics.gauge('retention', self.retention.stats)
+            self.metrics.gauge('replayed', lambda: self.replayer.replayed)
+            self.metrics.gauge('reliable', self.reliable.stats)
+        self.message_log = sampled_queue_logger('peer_node.messages', log_sample, [logging.StreamHandler(sys.stdout)])
+
         # Setup signal handler for graceful exit
         signal.signal(signal.SIGINT, self.shutdown)
 
@@ -26,6 +118,15 @@ class PeerNode:
         # Start a thread to listen for incoming messages from peers
         threading.Thread(target=self.listen, daemon=True).start()
 
+        # Announce interests and look up interested peers without holding up listen
+        threading.Thread(target=self.run_index_requests, daemon=True).start()
+
+        # Periodically tell the indexing server how busy this node is
+        threading.Thread(target=self.report_load_periodically, daemon=True).start()
+
+        # Keep the registration lease alive so the indexing server knows this node is up
+        threading.Thread(target=self.send_heartbeats, daemon=True).start()
+
     def shutdown(self, signum, frame):
         print("Shutting down peer node...")
         self.unregister_with_indexing_server()  # Unregister before exiting
@@ -35,72 +136,332 @@ class PeerNode:
     def register_with_indexing_server(self):
         """Register this peer node with the indexing server."""
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect(self.indexing_server)
-                register_message = {
-                    'action': 'register',
-                    'peer_id': self.port,  # Use port as the peer ID
-                    'peer_port': self.port
-                }
-                s.send(json.dumps(register_message).encode('utf-8'))
-                response = s.recv(1024).decode('utf-8')
-                print(f"Registration response: {response}")
+            register_message = {
+                'action': 'register',
+                'peer_id': self.port,  # Use port as the peer ID
+                'peer_port': self.port
+            }
+            response = self.index_pool.request(register_message)
+            print(f"Registration response: {response}")
+            if response.get('lease'):
+                self.heartbeat_interval = response['lease'] / HEARTBEATS_PER_LEASE
         except Exception as e:
             print(f"Error registering with indexing server: {e}")
 
     def unregister_with_indexing_server(self):
         """Unregister this peer node from the indexing server."""
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect(self.indexing_server)
-                unregister_message = {
-                    'action': 'unregister',
-                    'peer_id': self.port
-                }
-                s.send(json.dumps(unregister_message).encode('utf-8'))
-                response = s.recv(1024).decode('utf-8')
-                print(f"Unregistration response: {response}")
+            unregister_message = {
+                'action': 'unregister',
+                'peer_id': self.port
+            }
+            response = self.index_pool.request(unregister_message)
+            print(f"Unregistration response: {response}")
         except Exception as e:
             print(f"Error unregistering with indexing server: {e}")
 
+    def report_load(self, interval):
+        """Send this node's publish rate and subscriber count to the indexing server."""
+        try:
+            load, subscriber_count = self.measure_load(interval)
+            load_message = {
+                'action': 'report_load',
+                'peer_id': self.port,
+                'load': load,
+                'subscribers': subscriber_count
+            }
+            self.index_pool.request(load_message)
+        except Exception as e:
+            print(f"Error reporting load to indexing server: {e}")
+
+    def measure_load(self, interval):
+        """Return (publishes per second since the last call, subscriber count), from any thread."""
+        published = self.published_count  # Read rather than reset, so no increment made meanwhile is lost
+        load = (published - self.reported_count) / interval
+        self.reported_count = published
+        # Snapshot the values first: the listen thread may be adding a topic meanwhile
+        return load, sum(len(subscribers) for subscribers in list(self.subscribers.values()))
+
+    def report_load_periodically(self, interval=LOAD_REPORT_INTERVAL):
+        """Load-reporting thread used by the indexing server's load-aware selection policies."""
+        while True:
+            time.sleep(interval)
+            self.report_load(interval)
+
+    def send_heartbeats(self):
+        """Heartbeat thread: renew this node's lease, registering again if it has expired."""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                response = self.index_pool.request({'action': 'heartbeat', 'peer_id': self.port})
+                if response['status'] != 'success':
+                    print("Lease expired; registering with the indexing server again")
+                    self.reregister()
+            except Exception as e:
+                print(f"Error sending heartbeat to indexing server: {e}")
+
+    def reregister(self):
+        """Register again after the lease expired, restoring the interests dropped with the old registration."""
+        self.register_with_indexing_server()
+        self.reannounce_interests()
+
+    def reannounce_interests(self):
+        """Announce interest in every topic and pattern with local subscribers."""
+        for topic in list(self.subscribers) + [pattern for pattern, _ in self.patterns.items()]:
+            self.announce_interest(topic)
+
     def listen(self):
         """Listening thread that waits for incoming UDP messages."""
+        buffer = bytearray(MAX_DATAGRAM_SIZE)  # Reused for every datagram
+        view = memoryview(buffer)
         while True:
             try:
-                data, addr = self.socket.recvfrom(1024)  # Receive up to 1024 bytes of data
-                message = json.loads(data.decode())  # Decode and parse the incoming JSON message
-                print(f"Received message from {addr}: {message}")
-                self.handle_message(message, addr)   # Handle the message based on its type
+                size, addr = self.socket.recvfrom_into(buffer)
+                data = self.reassembler.add(view[:size], addr)
+                if data is None:
+                    continue  # Waiting for the remaining fragments of a message
+                message = decode_message(data)  # Parse the incoming JSON or binary message
+                self.message_log.info("Received message from %s: %s", addr, message)
+                self.handle_message(message, addr, detect_format(data))   # Handle the message based on its type
             except Exception as e:
+                self.metrics.incr('errors.receive')
                 print(f"Error receiving message: {e}")
 
-    def handle_message(self, message, addr):
+    def handle_message(self, message, addr, wire_format=JSON):
         """Handle incoming messages from peers."""
+        started = time.perf_counter()
         if message['type'] == 'publish':
-            self.distribute_message(message)  # Distribute the published message to subscribers
+            if 'seq' in message:
+                # Reliable publish: acknowledge every copy, but handle a retried one only once
+                seq = message.pop('seq')
+                self.send_notice({'type': 'ack', 'seq': seq}, addr, wire_format)
+                if self.seen_before((addr, seq)):
+                    self.metrics.incr('duplicates_dropped')
+                else:
+                    self.published_count += 1
+                    self.distribute_message(message)
+                    self.forward_message(message)
+            elif 'origin' in message:
+                # Forwarded by another peer node: deliver to local subscribers only, and only once
+                if self.seen_before((message.pop('origin'), message.pop('id'))):
+                    self.metrics.incr('duplicates_dropped')
+                else:
+                    self.published_count += 1
+                    self.distribute_message(message)
+            else:
+                self.published_count += 1
+                self.distribute_message(message)  # Distribute the published message to subscribers
+                self.forward_message(message)  # and to the other peer nodes that have subscribers for it
         elif message['type'] == 'subscribe':
-            self.subscribe(message['topic'], addr)  # Subscribe the peer to a specific topic
+            self.subscribe(message['topic'], addr, wire_format, message.get('offset'),  # Subscribe the peer to a specific topic
+                           message.get('reliable', False), message.get('window'))
+        elif message['type'] == 'ack':
+            if self.reliable is not None:
+                self.reliable.on_ack(message['topic'], addr, message['ack'], message.get('sacks', ()),
+                                     message.get('window'))
+        elif message['type'] == 'nack':
+            if self.reliable is not None:
+                self.reliable.on_nack(message['topic'], addr, message.get('missing', []))
+        elif message['type'] == 'invalidate':
+            with self.forward_lock:
+                for topic in message.get('topics', ()):
+                    self.interest_cache.invalidate(topic)  # The set of interested peers changed
+                    if topic in self.pending_forwards:
+                        self.stale_lookups.add(topic)  # The answer in flight may predate the change
+        elif message['type'] == 'stats':
+            self.send_stats(addr, wire_format)
         else:
             print(f"Unknown message type: {message['type']}")
+        message_type = message['type'] if message['type'] in MESSAGE_TYPES else 'unknown'
+        self.metrics.observe(f"latency_ms.{message_type}", (time.perf_counter() - started) * 1e3)
+        self.metrics.incr(f"messages.{message_type}")
+
+    def send_stats(self, addr, wire_format=JSON):
+        """Answer a 'stats' message with this node's counters, histograms and gauges."""
+        self.send_notice({'type': 'stats', 'peer_id': self.port, 'stats': self.metrics.snapshot()}, addr, wire_format)
 
-    def subscribe(self, topic, addr):
-        """Subscribe a peer (identified by addr) to a specific topic."""
+    def send_notice(self, message, addr, wire_format=JSON):
+        """Send one control message (stats reply, ack, gap notice) straight from this thread."""
+        for datagram in fragment(encode_message(message, wire_format)):
+            self.socket.sendto(datagram, addr)
+
+    def subscribe(self, topic, addr, wire_format=JSON, offset=None, reliable=False, window=None):
+        """Subscribe a peer (identified by addr) to a specific topic.
+
+        Messages are delivered to the subscriber in the wire format it subscribed with.
+        With an offset, retained messages from that offset on are replayed first
+        (a negative offset counts back from the newest message); offsets that
+        are no longer retained are skipped.
+
+        A reliable subscriber acknowledges what it receives and gets lost messages
+        retransmitted, at a pace set by its acknowledgements and receive window.
+
+        topic may be a wildcard pattern ('sensors/*/temp', 'sensors/eu/#'), which
+        subscribes to every matching topic, including ones first published later.
+        """
+        if is_pattern(topic):
+            if offset is not None or reliable:
+                print(f"Replay and reliable delivery need an exact topic; subscribing {addr} to '{topic}' without them")
+            self.subscribe_pattern(topic, addr, wire_format)
+            return
         if topic not in self.subscribers:
-            self.subscribers[topic] = []  # Initialize the list of subscribers for this topic
+            self.subscribers[topic] = {}  # Initialize the set of subscribers for this topic
+            self.announce_interest(topic)  # Ask other peer nodes to forward this topic's publishes here
         if addr not in self.subscribers[topic]:
-            self.subscribers[topic].append(addr)  # Add the peer's address to the list of subscribers
-            print(f"Subscribed {addr} to topic '{topic}'")
+            self.message_log.info("Subscribed %s to topic '%s'", addr, topic)
+        if self.retention is None:
+            if reliable:
+                print(f"Retention is disabled; subscribing {addr} to topic '{topic}' without reliable delivery")
+            self.subscribers[topic][addr] = wire_format
+            return
+        # Publishes are handled on this same thread, so live delivery picks up exactly at end
+        first, end = self.retention.bounds(topic)
+        start = end if offset is None else max(end + offset if offset < 0 else offset, first)
+        if reliable:
+            self.subscribers[topic].pop(addr, None)
+            self.reliable.open(topic, addr, wire_format, start, window)
+            return
+        self.reliable.close(topic, addr)  # A plain subscription replaces a reliable one
+        self.subscribers[topic][addr] = wire_format  # Add the peer's address to the subscribers
+        if offset is not None:
+            self.replayer.replay(topic, start, end, addr, wire_format)
+
+    def subscribe_pattern(self, pattern, addr, wire_format=JSON):
+        """Subscribe a peer to every topic matching a wildcard pattern."""
+        validate_pattern(pattern)
+        subscribers = self.patterns.get(pattern)
+        if subscribers is None:
+            subscribers = self.patterns.setdefault(pattern, {})
+            self.announce_interest(pattern)  # Other peer nodes forward every matching topic here
+        if addr not in subscribers:
+            self.message_log.info("Subscribed %s to pattern '%s'", addr, pattern)
+        subscribers[addr] = wire_format
+
+    def send_replay(self, payloads, addr, wire_format):
+        """Send retained messages (stored JSON-encoded) to a catching-up subscriber."""
+        for payload in payloads:
+            if wire_format == BINARY:
+                payload = encode_message(decode_message(payload), BINARY)
+            for datagram in fragment(payload):
+                self.socket.sendto(datagram, addr)
+
+    def run_index_requests(self):
+        """Index request thread: make the queued announcements and lookups, one at a time."""
+        while True:
+            function, topic = self.index_requests.get()
+            try:
+                function(topic)
+            except Exception as e:
+                print(f"Error in indexing server request for topic '{topic}': {e}")
+
+    def announce_interest(self, topic):
+        """Queue telling the indexing server this node has subscribers for topic."""
+        self.index_requests.put((self.send_interest, topic))
+
+    def send_interest(self, topic):
+        """Tell the indexing server this node has subscribers for topic."""
+        try:
+            response = self.index_pool.request({'action': 'add_interest', 'peer_id': self.port, 'topic': topic})
+            if response['status'] != 'success':
+                print(f"Could not announce interest in topic '{topic}': {response['message']}")
+        except Exception as e:
+            print(f"Error announcing interest in topic '{topic}': {e}")
+
+    def interested_peers(self, topic):
+        """Ask the indexing server for the other peer nodes with subscribers for topic; None if that fails."""
+        try:
+            # The watch asks the indexing server to tell this node when the answer changes
+            response = self.index_pool.request({'action': 'query_interest', 'topic': topic, 'watch': self.port})
+        except Exception as e:
+            print(f"Error querying interest in topic '{topic}': {e}")
+            return None
+        return [tuple(peer['peer_info']) for peer in response.get('peers', ()) if peer['peer_id'] != self.port]
+
+    def forward_message(self, message):
+        """Send a publish once to every other peer node with subscribers for its topic.
+
+        On a cache miss the publish waits (behind any others already waiting for
+        the topic) while the index request thread looks the topic up.
+        """
+        topic = message['topic']
+        with self.forward_lock:
+            pending = self.pending_forwards.get(topic)
+            if pending is None:
+                peers = self.interest_cache.get(topic)
+                if peers is None:
+                    if self.failed_lookups.get(topic):
+                        self.metrics.incr('forwards_unresolved')  # The indexing server was just unreachable
+                        return
+                    pending = self.pending_forwards[topic] = []
+                    self.index_requests.put((self.resolve_forwards, topic))
+            if pending is not None:
+                if len(pending) < MAX_PENDING_FORWARDS:
+                    pending.append(message)
+                else:
+                    self.metrics.incr('forwards_unresolved')
+                return
+        self.send_forward(message, peers)
+
+    def resolve_forwards(self, topic):
+        """Look up topic's interested peers, cache them and forward the publishes that waited for them."""
+        peers = self.interested_peers(topic)
+        with self.forward_lock:
+            messages = self.pending_forwards.pop(topic, [])
+            stale = topic in self.stale_lookups
+            self.stale_lookups.discard(topic)
+            if peers is None:
+                self.failed_lookups.put(topic, True)
+                self.metrics.incr('forwards_unresolved', len(messages))
+                return
+            if not stale:
+                self.interest_cache.put(topic, peers)
+            for message in messages:
+                self.send_forward(message, peers)
+
+    def send_forward(self, message, peers):
+        """Send a publish to each of peers, tagged so that every one delivers it only once."""
+        if peers:
+            forwarded = dict(message, origin=self.port, id=new_message_id())
+            self.fanout.submit(fragment(encode_message(forwarded, self.wire_format)), peers)
+            self.metrics.incr('forwarded', len(peers))
+
+    def seen_before(self, key):
+        """Remember key among the last DEDUP_WINDOW forwarded messages; True if it was already there."""
+        if key in self.seen_messages:
+            return True
+        self.seen_messages[key] = None
+        if len(self.seen_messages) > DEDUP_WINDOW:
+            self.seen_messages.popitem(last=False)
+        return False
 
     def distribute_message(self, message):
         """Distribute a published message to all subscribers of the topic."""
         topic = message['topic']
-        if topic in self.subscribers:
-            for subscriber in self.subscribers[topic]:
-                try:
-                    self.socket.sendto(json.dumps(message).encode(), subscriber)
-                    print(f"Sent message to {subscriber}")
-                except Exception as e:
-                    print(f"Error sending message to {subscriber}: {e}")
+        payload = None
+        if self.retention is not None:
+            # Stamp the topic offset and retain the JSON encoding, which also serves JSON subscribers
+            message = dict(message, offset=self.retention.next_offset(topic))
+            payload = encode_message(message, JSON)
+            self.retention.append(topic, payload)
+            self.reliable.notify(topic)
+        subscribers = self.subscribers.get(topic)
+        if self.patterns:
+            # Walks one trie branch per topic level, however many patterns are subscribed
+            matched = [pattern_subscribers for _, pattern_subscribers in self.patterns.match(topic)]
+            if matched:
+                subscribers = dict(subscribers or ())
+                for pattern_subscribers in matched:
+                    for addr, wire_format in pattern_subscribers.items():
+                        subscribers.setdefault(addr, wire_format)  # One copy per subscriber, however many matches
+        if subscribers:
+            self.metrics.observe('fanout_subscribers', len(subscribers))
+            binary_subscribers = [addr for addr, wire_format in subscribers.items() if wire_format == BINARY]
+            if binary_subscribers:
+                # Serialize once per wire format in use, not once per subscriber
+                self.fanout.submit(fragment(encode_message(message, BINARY)), binary_subscribers)
+                subscribers = [addr for addr, wire_format in subscribers.items() if wire_format == JSON]
+            if subscribers:
+                self.fanout.submit(fragment(payload or encode_message(message, JSON)), subscribers)
 
 if __name__ == "__main__":
     port = input("Enter a port number (or leave blank to use a random port): ")
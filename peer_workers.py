@@ -0,0 +1,175 @@
+"""Run one logical peer node as several worker processes sharing its UDP port.
+
+Every worker binds the node's port with SO_REUSEPORT, so the kernel spreads
+incoming datagrams across them by sender. Each topic is owned by exactly one
+worker (hash of the topic), which keeps that topic's subscribers, retention
+and forwarding state; a worker receiving a message for a topic it does not own
+hands it to the owner over a private localhost socket. All workers register
+under the same peer id, so the indexing server sees a single peer.
+"""
+import argparse
+import multiprocessing
+import signal
+import socket
+import struct
+import sys
+import threading
+
+from chunking import MAX_DATAGRAM_SIZE, Reassembler, fragment, reseed_message_ids
+from codec import JSON, WIRE_FORMATS, decode_message, detect_format, encode_message
+from connection_pool import DEFAULT_POOL_SIZE
+from fanout import DEFAULT_SENDERS
+from peer_node import PeerNode
+from reliable import DEFAULT_SLOW_POLICY, SLOW_POLICIES
+from shard_ring import ring_hash
+from topic_trie import is_pattern
+
+# A message handed from the worker that received it to the topic's owner:
+#   sender IPv4 address (4) | sender port (2) | encoded message, fragmented like any other
+HANDOFF_HEADER = struct.Struct('!4sH')
+ROUTED_TYPES = {'publish', 'subscribe', 'ack', 'nack'}  # Message types handled by the owner of their topic
+REANNOUNCE = 'reannounce'  # Hand-off only: the node registered again, announce this worker's interests
+
+
+def owner_of(topic, workers):
+    """Index of the worker owning topic; stable across processes, unlike hash()."""
+    return ring_hash(topic) % workers
+
+
+class PeerWorker(PeerNode):
+    """One worker process of a multi-process peer node."""
+
+    def __init__(self, worker, handoff_sockets, load_slots, port, **options):
+        self.worker = worker  # Index of this worker
+        self.workers = len(handoff_sockets)
+        self.handoff_socket = handoff_sockets[worker]  # Receives messages handed over by the other workers
+        self.handoff_addresses = [sock.getsockname() for sock in handoff_sockets]
+        self.load_slots = load_slots  # Shared [load, subscribers] per worker, summed into one load report
+        self.dispatch_lock = threading.Lock()  # Serializes handling between the two receive threads
+        self.handoff_reassembler = Reassembler()
+        reseed_message_ids()  # Workers share a port, so their message and fragment ids must differ
+        super().__init__(port=port, reuse_port=True, **options)
+        self.metrics.gauge('worker', lambda: self.worker)
+        threading.Thread(target=self.listen_handoffs, daemon=True).start()
+
+    def handle_message(self, message, addr, wire_format=JSON):
+        if message['type'] == 'subscribe' and is_pattern(message.get('topic', '')):
+            # A pattern can match topics of every owner, so every worker keeps it for its own topics
+            for owner in range(self.workers):
+                if owner != self.worker:
+                    self.hand_off(owner, message, addr, wire_format)
+        elif message['type'] in ROUTED_TYPES and 'topic' in message:
+            owner = owner_of(message['topic'], self.workers)
+            if owner != self.worker:
+                self.hand_off(owner, message, addr, wire_format)
+                return
+        elif message['type'] == 'invalidate':
+            # Cached interest sets live with each topic's owner; let every worker drop its entries
+            for owner in range(self.workers):
+                if owner != self.worker:
+                    self.hand_off(owner, message, addr, wire_format)
+        with self.dispatch_lock:
+            super().handle_message(message, addr, wire_format)
+
+    def reregister(self):
+        """Register again; the registration is shared, so every worker re-announces its own interests."""
+        super().reregister()
+        for owner in range(self.workers):
+            if owner != self.worker:
+                self.hand_off(owner, {'type': REANNOUNCE}, ('0.0.0.0', 0), JSON)
+
+    def hand_off(self, owner, message, addr, wire_format):
+        """Pass a message, with the address it came from, to another worker."""
+        header = HANDOFF_HEADER.pack(socket.inet_aton(addr[0]), addr[1])
+        for datagram in fragment(header + encode_message(message, wire_format)):
+            self.handoff_socket.sendto(datagram, self.handoff_addresses[owner])
+        self.metrics.incr('handed_off')
+
+    def listen_handoffs(self):
+        """Receive thread for messages other workers hand to this one."""
+        buffer = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buffer)
+        while True:
+            try:
+                size, sender = self.handoff_socket.recvfrom_into(buffer)
+                data = self.handoff_reassembler.add(view[:size], sender)
+                if data is None:
+                    continue
+                host, port = HANDOFF_HEADER.unpack_from(data)
+                data = data[HANDOFF_HEADER.size:]
+                message = decode_message(data)
+                with self.dispatch_lock:
+                    if message['type'] == REANNOUNCE:
+                        self.reannounce_interests()
+                        continue
+                    # Handled directly: the owner never routes a handed-off message again
+                    PeerNode.handle_message(self, message, (socket.inet_ntoa(host), port), detect_format(data))
+            except Exception as e:
+                print(f"Error receiving handed-off message: {e}")
+
+    def report_load(self, interval):
+        """Publish this worker's share of the load; worker 0 reports the node's total."""
+        try:
+            self.load_slots[2 * self.worker], self.load_slots[2 * self.worker + 1] = self.measure_load(interval)
+            if self.worker != 0:
+                return
+            load_message = {
+                'action': 'report_load',
+                'peer_id': self.port,
+                'load': sum(self.load_slots[0::2]),
+                'subscribers': int(sum(self.load_slots[1::2]))
+            }
+            self.index_pool.request(load_message)
+        except Exception as e:
+            print(f"Error reporting load to indexing server: {e}")
+
+
+def serve_worker(worker, handoff_sockets, load_slots, port, options):
+    """Entry point of one worker process."""
+    PeerWorker(worker, handoff_sockets, load_slots, port, **options)
+    threading.Event().wait()  # The node runs on daemon threads
+
+
+def run_workers(port, workers, **options):
+    """Run a peer node on port as workers processes; options are passed to PeerNode."""
+    # Hand-off sockets are bound before forking so every worker knows every other worker's address
+    handoff_sockets = []
+    for _ in range(workers):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        handoff_sockets.append(sock)
+    load_slots = multiprocessing.Array('d', 2 * workers, lock=False)
+    context = multiprocessing.get_context('fork')  # Workers inherit the hand-off sockets
+    processes = [context.Process(target=serve_worker, args=(worker, handoff_sockets, load_slots, port, options))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"Started peer node on port {port} with {workers} workers")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Stop the workers along with this process
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a peer node as several worker processes.')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--index-host', default='localhost')
+    parser.add_argument('--index-port', type=int, default=9000)
+    parser.add_argument('--wire-format', choices=WIRE_FORMATS, default=JSON)
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE)
+    parser.add_argument('--senders', type=int, default=DEFAULT_SENDERS, help='Fan-out sender threads per worker')
+    parser.add_argument('--log-sample', type=int, default=0,
+                        help='Print one in this many received messages per worker (0 disables)')
+    parser.add_argument('--retention', action='store_true',
+                        help='Retain recent messages per topic for replay from an offset and reliable delivery')
+    parser.add_argument('--slow-policy', choices=SLOW_POLICIES, default=DEFAULT_SLOW_POLICY,
+                        help='What happens to a reliable subscriber that falls behind the retention buffer')
+    args = parser.parse_args()
+    run_workers(args.port, args.workers, indexing_server_host=args.index_host, indexing_server_port=args.index_port,
+                wire_format=args.wire_format, pool_size=args.pool_size, senders=args.senders,
+                log_sample=args.log_sample, retention=args.retention, slow_policy=args.slow_policy)
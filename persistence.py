@@ -0,0 +1,225 @@
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+DEFAULT_COMMIT_DELAY = 0.0  # Extra seconds the writer waits to gather a larger group per fsync
+DEFAULT_SNAPSHOT_EVERY = 200000  # Logged records between compacted snapshots
+SNAPSHOT_FILE = 'snapshot.jsonl'
+SEGMENT_PREFIX = 'wal-'
+SEGMENT_SUFFIX = '.log'
+
+_ROTATE = object()  # Marker queued by rotate(): start a new segment after everything before it
+
+
+def encode_record(record):
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def read_records(path):
+    """Yield the JSON records of a line-oriented file, reading it through a memory map.
+
+    A truncated final line (a crash mid-write) is ignored.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.endswith(b'\n'):
+                    break
+                yield json.loads(line)
+
+
+class WriteAheadLog:
+    """Append-only log of registry mutations with group-commit fsync and compacted snapshots.
+
+    append() only queues a record. A writer thread writes everything queued while
+    the previous fsync was running and fsyncs once for the whole group, then wakes
+    the callers waiting on those records. The log is split into numbered segments
+    so that a snapshot can replace every segment written before it.
+    """
+
+    def __init__(self, directory, commit_delay=DEFAULT_COMMIT_DELAY):
+        self.directory = directory
+        self.commit_delay = commit_delay
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        # Segment receiving newly appended records; never one the snapshot already covers, even if
+        # a crash came after the snapshot dropped the old segments but before the new one was created
+        self.segment = max(segments[-1] if segments else 0, self.snapshot_segment())
+        self.file = None  # Opened by the writer thread
+        self.pending = []  # Encoded records (or _ROTATE markers) not yet written
+        self.appended = 0  # Sequence number of the last appended record
+        self.durable = 0  # Sequence number of the last record known to be on disk
+        self.error = None  # Exception that stopped the writer thread; nothing appended after it becomes durable
+        self.records_since_snapshot = 0
+        self.cond = threading.Condition()
+        self.async_waiters = []  # [(seq, loop, future)] resolved once seq is durable
+        self.writer = None
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}")
+
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    def segments(self):
+        """Return the numbers of the log segments on disk, oldest first."""
+        names = (name for name in os.listdir(self.directory)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in names)
+
+    def snapshot_segment(self):
+        """Return the first segment not covered by the snapshot, 0 if there is none."""
+        if not os.path.exists(self.snapshot_path()):
+            return 0
+        return next(read_records(self.snapshot_path()))['segment']
+
+    def load(self):
+        """Return (snapshot rows, log records) describing the persisted state.
+
+        Snapshot rows are [peer_id, host, port, [topics], [interests]]; the log
+        records are the mutations made after that snapshot, oldest first. Call
+        before start().
+        """
+        first_segment = 0
+        rows = []
+        if os.path.exists(self.snapshot_path()):
+            snapshot = read_records(self.snapshot_path())
+            first_segment = next(snapshot)['segment']
+            rows = snapshot
+
+        def records():
+            for segment in self.segments():
+                if segment >= first_segment:
+                    yield from read_records(self.segment_path(segment))
+        return rows, records()
+
+    def start(self):
+        """Open the current segment for appending and start the writer thread."""
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.writer = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer.start()
+
+    def append(self, record):
+        """Queue a record for the next group commit and return its sequence number."""
+        line = encode_record(record)
+        with self.cond:
+            self.pending.append(line)
+            self.appended += 1
+            self.records_since_snapshot += 1
+            self.cond.notify_all()
+            return self.appended
+
+    def wait_durable(self, seq):
+        """Block until the record with sequence number seq has been fsynced; raises the writer's error if it failed."""
+        with self.cond:
+            while self.durable < seq:
+                if self.error is not None:
+                    raise self.error
+                self.cond.wait()
+
+    def wait_durable_async(self, seq, loop):
+        """Return an asyncio future (on loop) that completes once seq has been fsynced, or fails with the writer."""
+        future = loop.create_future()
+        with self.cond:
+            if self.durable >= seq:
+                future.set_result(None)
+            elif self.error is not None:
+                future.set_exception(self.error)
+            else:
+                self.async_waiters.append((seq, loop, future))
+        return future
+
+    def rotate(self):
+        """Send records appended from now on to a new segment; returns its number.
+
+        Call while the state being logged cannot change, so that the new segment
+        holds exactly the mutations made after that state.
+        """
+        with self.cond:
+            self.pending.append(_ROTATE)
+            self.segment += 1
+            self.records_since_snapshot = 0
+            self.cond.notify_all()
+            return self.segment
+
+    def write_snapshot(self, segment, rows):
+        """Atomically replace the snapshot with rows, covering every segment before segment."""
+        path = self.snapshot_path()
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(encode_record({'segment': segment}))
+            for row in rows:
+                f.write(encode_record(row))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)  # Make the rename itself durable
+        finally:
+            os.close(directory)
+        for old in self.segments():
+            if old < segment:
+                os.remove(self.segment_path(old))
+
+    def run_writer(self):
+        """Writer thread: write and fsync queued records in groups.
+
+        If a write or fsync fails, the error is kept in self.error, every waiter
+        is woken with it and the thread stops: the log can no longer be trusted.
+        """
+        try:
+            self.write_groups()
+        except Exception as e:
+            logging.error(f"Write-ahead log writer failed, no further changes will be durable: {e}")
+            with self.cond:
+                self.error = e
+                failed, self.async_waiters = self.async_waiters, []
+                self.cond.notify_all()
+            for _, loop, future in failed:
+                loop.call_soon_threadsafe(_fail, future, e)
+
+    def write_groups(self):
+        file_segment = self.segment
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self.cond:
+                batch, self.pending = self.pending, []
+                target = self.appended
+            for item in batch:
+                if item is _ROTATE:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.file.close()
+                    file_segment += 1
+                    self.file = open(self.segment_path(file_segment), 'ab')
+                else:
+                    self.file.write(item)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            with self.cond:
+                self.durable = target
+                ready = [waiter for waiter in self.async_waiters if waiter[0] <= target]
+                self.async_waiters = [waiter for waiter in self.async_waiters if waiter[0] > target]
+                self.cond.notify_all()
+            for _, loop, future in ready:
+                loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,397 @@
+import threading
+import time
+
+# Reliable delivery: a subscriber that asks for it receives a topic's messages from the retention
+# buffer, where each message's offset is its sequence number. The subscriber acknowledges what it
+# holds (cumulative ack plus selective ranges) and names holes in nacks; the peer node retransmits
+# from the buffer and paces each subscriber with its own congestion and receive windows.
+DEFAULT_SEND_WINDOW = 256  # Most unacknowledged messages in flight to one subscriber
+DEFAULT_RECEIVE_WINDOW = 256  # Out-of-order messages a receiver buffers; advertised to the sender
+INITIAL_CONGESTION_WINDOW = 16  # Messages sent before the first acknowledgement
+INITIAL_RETRANSMIT_TIMEOUT = 0.2  # Seconds, until round-trip times have been measured
+MIN_RETRANSMIT_TIMEOUT = 0.02
+MAX_RETRANSMIT_TIMEOUT = 2.0
+MAX_TIMEOUTS = 8  # Consecutive retransmit timeouts before a subscriber is considered gone
+SEND_TICK = 0.005  # Seconds between passes of the sender thread when nothing wakes it
+ACK_EVERY = 8  # In-order messages received between acknowledgements
+ACK_INTERVAL = 0.02  # Seconds: unacknowledged messages are acknowledged at least this often
+NACK_INTERVAL = 0.05  # Seconds before a receiver asks again for the same missing message
+SUBSCRIBE_RETRY = 0.2  # Seconds before a receiver that has heard nothing repeats its subscribe request
+MAX_NACK = 64  # Offsets named in one nack
+SLOW_POLICIES = ('skip', 'drop')  # What happens to a subscriber whose unacknowledged messages are evicted
+DEFAULT_SLOW_POLICY = 'skip'
+
+
+class ReliableSession:
+    """Send state of one reliable subscriber of one topic."""
+
+    def __init__(self, topic, addr, wire_format, start, window, now):
+        self.topic = topic
+        self.addr = addr
+        self.wire_format = wire_format
+        self.acked = start  # Every offset below this has been received (or skipped)
+        self.next = start  # Next offset to send for the first time
+        self.in_flight = {}  # {offset: time first sent, None once retransmitted} for unacknowledged offsets
+        self.resend = set()  # Offsets the subscriber reported missing
+        self.window = window  # Receive window last advertised by the subscriber
+        self.cwnd = float(INITIAL_CONGESTION_WINDOW)  # Congestion window, in messages
+        self.ssthresh = float(DEFAULT_SEND_WINDOW)
+        self.srtt = None  # Smoothed round-trip time
+        self.rttvar = 0.0
+        self.rto = INITIAL_RETRANSMIT_TIMEOUT
+        self.timer = now  # Retransmit timer: restarted on progress
+        self.timeouts = 0  # Consecutive timeouts without progress
+        self.reduced = 0.0  # When the congestion window was last cut
+        self.synced = False  # The subscriber has acknowledged its starting offset
+        self.gap_pending = True  # A gap notice (telling the subscriber where the stream starts) is due
+
+    def on_ack(self, ack, ranges, window, now):
+        """Apply an acknowledgement: ack is the next offset the subscriber expects, ranges [[start, end)] it holds beyond."""
+        self.synced = True
+        if window is not None:
+            self.window = max(int(window), 1)
+        acked = []
+        if ack > self.acked:
+            for offset in range(self.acked, min(ack, self.next)):
+                acked.append(self.in_flight.pop(offset, None))
+            self.acked = min(ack, self.next)
+        for start, end in ranges:
+            for offset in range(max(start, self.acked), min(end, self.next)):
+                if offset in self.in_flight:
+                    acked.append(self.in_flight.pop(offset))
+        self.resend.intersection_update(self.in_flight)
+        if not acked:
+            return
+        sent = max((t for t in acked if t is not None), default=None)  # Retransmitted offsets give no sample
+        if sent is not None:
+            self.sample_rtt(now - sent)
+        self.timer = now
+        self.timeouts = 0
+        if self.cwnd < self.ssthresh:
+            self.cwnd += len(acked)  # Slow start
+        else:
+            self.cwnd += len(acked) / self.cwnd  # Congestion avoidance
+        self.cwnd = min(self.cwnd, DEFAULT_SEND_WINDOW)
+
+    def on_nack(self, missing, now):
+        for offset in missing:
+            if offset < self.acked:
+                self.gap_pending = True  # Skipped: tell the subscriber again not to wait for it
+            elif offset in self.in_flight:
+                self.resend.add(offset)
+        if self.resend:
+            self.reduce(now)
+
+    def on_timeout(self, now):
+        """Nothing was acknowledged for a retransmit timeout: resend what is still in flight and back off."""
+        self.timeouts += 1
+        self.resend.update(self.in_flight)  # Selectively acknowledged offsets have left in_flight already
+        if not self.synced:
+            self.gap_pending = True
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = 1.0
+        self.rto = min(self.rto * 2, MAX_RETRANSMIT_TIMEOUT)
+        self.timer = now
+
+    def reduce(self, now):
+        """Halve the congestion window, at most once per round trip."""
+        if now - self.reduced >= (self.srtt or self.rto):
+            self.ssthresh = max(self.cwnd / 2, 2.0)
+            self.cwnd = self.ssthresh
+            self.reduced = now
+
+    def sample_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RETRANSMIT_TIMEOUT), MAX_RETRANSMIT_TIMEOUT)
+
+    def send_limit(self):
+        """Offset below which messages may be in flight."""
+        return self.acked + int(min(self.cwnd, self.window, DEFAULT_SEND_WINDOW))
+
+
+class ReliableSender:
+    """Delivers topics from a RetentionStore to reliable subscribers.
+
+    One thread serves every session: it retransmits what subscribers nack or
+    what times out, then sends new messages up to each session's window. A
+    subscriber that stops acknowledging only stalls its own session; once its
+    oldest unacknowledged message is evicted from retention, slow_policy
+    decides whether it skips ahead ('skip') or is unsubscribed ('drop').
+    """
+
+    def __init__(self, store, send, send_notice, slow_policy=DEFAULT_SLOW_POLICY):
+        if slow_policy not in SLOW_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy '{slow_policy}'")
+        self.store = store
+        self.send = send  # Called as send(payloads, addr, wire_format) with a list of stored payloads
+        self.send_notice = send_notice  # Called as send_notice(message, addr, wire_format)
+        self.slow_policy = slow_policy
+        self.sessions = {}  # {(topic, addr): ReliableSession}
+        self.topics = {}  # {topic: number of sessions}
+        self.cond = threading.Condition()
+        self.sent = 0  # Messages sent for the first time
+        self.retransmitted = 0
+        self.skipped = 0  # Messages evicted before a subscriber acknowledged them
+        self.dropped = 0  # Sessions closed by the drop policy or for not responding
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def open(self, topic, addr, wire_format, start, window=None):
+        """Start reliable delivery of topic to addr from offset start.
+
+        A repeated request for an open session only repeats its gap notice, so
+        the subscriber can retry a lost subscribe without losing its place.
+        """
+        with self.cond:
+            session = self.sessions.get((topic, addr))
+            if session is not None:
+                session.gap_pending = True
+            else:
+                self.topics[topic] = self.topics.get(topic, 0) + 1
+                self.sessions[topic, addr] = ReliableSession(topic, addr, wire_format, start,
+                                                             window or DEFAULT_RECEIVE_WINDOW, time.monotonic())
+            self.cond.notify()
+
+    def close(self, topic, addr):
+        with self.cond:
+            self.remove(topic, addr)
+
+    def remove(self, topic, addr):
+        if self.sessions.pop((topic, addr), None) is not None:
+            self.topics[topic] -= 1
+            if not self.topics[topic]:
+                del self.topics[topic]
+
+    def notify(self, topic):
+        """Wake the sender after a message was retained for topic."""
+        if topic in self.topics:
+            with self.cond:
+                self.cond.notify()
+
+    def on_ack(self, topic, addr, ack, ranges=(), window=None):
+        with self.cond:
+            session = self.sessions.get((topic, addr))
+            if session is not None:
+                session.on_ack(ack, ranges, window, time.monotonic())
+                self.cond.notify()
+
+    def on_nack(self, topic, addr, missing):
+        with self.cond:
+            session = self.sessions.get((topic, addr))
+            if session is not None:
+                session.on_nack(missing[:MAX_NACK], time.monotonic())
+                self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {'sessions': len(self.sessions), 'sent': self.sent, 'retransmitted': self.retransmitted,
+                    'skipped': self.skipped, 'dropped': self.dropped}
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait(SEND_TICK)
+                now = time.monotonic()
+                work = [self.service(session, now) for session in list(self.sessions.values())]
+            for addr, wire_format, notices, payloads in work:
+                try:
+                    for notice in notices:
+                        self.send_notice(notice, addr, wire_format)
+                    if payloads:
+                        self.send(payloads, addr, wire_format)
+                except OSError as e:
+                    print(f"Error sending to reliable subscriber {addr}: {e}")
+
+    def service(self, session, now):
+        """Decide what session needs sent now; returns (addr, wire_format, notices, payloads)."""
+        topic = session.topic
+        notices = []
+        first, end = self.store.bounds(topic)
+        if session.acked < first:
+            if self.slow_policy == 'drop':
+                self.remove(topic, session.addr)
+                self.dropped += 1
+                notices.append({'type': 'gap', 'topic': topic, 'end': first, 'closed': True})
+                return session.addr, session.wire_format, notices, []
+            self.skipped += first - session.acked
+            for offset in range(session.acked, min(first, session.next)):
+                session.in_flight.pop(offset, None)
+            session.resend.intersection_update(session.in_flight)
+            session.acked = first
+            session.next = max(session.next, first)
+            session.gap_pending = True
+        if session.in_flight and now - session.timer >= session.rto:
+            if session.timeouts >= MAX_TIMEOUTS:
+                self.remove(topic, session.addr)
+                self.dropped += 1
+                notices.append({'type': 'gap', 'topic': topic, 'end': session.acked, 'closed': True})
+                return session.addr, session.wire_format, notices, []
+            session.on_timeout(now)
+        if session.gap_pending:
+            notices.append({'type': 'gap', 'topic': topic, 'end': session.acked})
+            session.gap_pending = False
+
+        payloads = []
+        for offset in sorted(session.resend):
+            payloads.extend(payload for _, payload in self.store.read(topic, offset, offset + 1))
+            session.in_flight[offset] = None
+        self.retransmitted += len(session.resend)
+        session.resend.clear()
+        limit = min(end, session.send_limit())
+        if session.next < limit:
+            if not session.in_flight:
+                session.timer = now
+            for offset, payload in self.store.read(topic, session.next, limit):
+                payloads.append(payload)
+                session.in_flight[offset] = now
+            self.sent += limit - session.next
+            session.next = limit
+        return session.addr, session.wire_format, notices, payloads
+
+
+class ReceiveStream:
+    """Receive state of one reliable topic."""
+
+    def __init__(self, request):
+        self.request = request  # Subscribe message, repeated until the sender answers
+        self.requested = time.monotonic()
+        self.expected = None  # Next offset to deliver; unknown until the sender's first gap notice
+        self.buffer = {}  # {offset: message} received ahead of expected
+        self.unacked = 0  # Messages delivered since the last acknowledgement
+        self.last_ack = 0.0
+        self.nacked = {}  # {offset: when last asked for}
+
+
+class ReliableReceiver:
+    """Puts a client's reliable topics back in order, acknowledging and nacking as it goes.
+
+    receive() and gap() return the messages now deliverable in offset order; a
+    background thread acknowledges at least every ACK_INTERVAL and asks again
+    for holes that stay open, so lost acks and nacks are repaired too.
+    """
+
+    def __init__(self, send, window=DEFAULT_RECEIVE_WINDOW):
+        self.send = send  # Called with each ack or nack message for the peer node
+        self.window = window
+        self.streams = {}  # {topic: ReceiveStream}
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.lost = 0  # Messages the sender skipped under its slow consumer policy
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def open(self, topic, request):
+        """Track topic as reliable; request is the subscribe message to repeat if it goes unanswered."""
+        with self.lock:
+            self.streams[topic] = ReceiveStream(request)
+
+    def receive(self, message):
+        topic = message.get('topic')
+        with self.lock:
+            stream = self.streams.get(topic)
+            if stream is None or 'offset' not in message:
+                return [message]  # Not a reliable topic
+            offset = message['offset']
+            expected = stream.expected
+            if (expected is not None and offset < expected) or offset in stream.buffer:
+                self.duplicates += 1
+                if expected is not None:
+                    self.ack(topic, stream)  # Our acknowledgement may have been lost: repeat it
+                return []
+            if offset >= (expected if expected is not None else offset) + self.window:
+                return []  # Beyond the advertised window
+            filling = bool(stream.buffer)
+            stream.buffer[offset] = message
+            stream.nacked.pop(offset, None)
+            if expected is None:
+                return []
+            delivered = self.drain(stream)
+            if stream.buffer:
+                self.nack(topic, stream, time.monotonic())
+            if filling or stream.buffer or stream.unacked >= ACK_EVERY:
+                self.ack(topic, stream)
+            return delivered
+
+    def gap(self, message):
+        """Apply a gap notice: the sender will not send offsets below message['end']."""
+        topic = message.get('topic')
+        with self.lock:
+            stream = self.streams.get(topic)
+            if stream is None:
+                return []
+            if message.get('closed'):
+                del self.streams[topic]
+                print(f"Peer node stopped reliable delivery of topic '{topic}': this subscriber fell behind "
+                      f"or stopped acknowledging")
+                return []
+            end = message['end']
+            if stream.expected is None:
+                stream.expected = end
+            elif end > stream.expected:
+                self.lost += sum(1 for offset in range(stream.expected, end) if offset not in stream.buffer)
+                stream.expected = end
+            for offset in [offset for offset in stream.buffer if offset < stream.expected]:
+                del stream.buffer[offset]
+            delivered = self.drain(stream)
+            self.ack(topic, stream)
+            return delivered
+
+    def drain(self, stream):
+        delivered = []
+        while stream.expected in stream.buffer:
+            delivered.append(stream.buffer.pop(stream.expected))
+            stream.expected += 1
+        stream.unacked += len(delivered)
+        return delivered
+
+    def ack(self, topic, stream):
+        ranges = []
+        for offset in sorted(stream.buffer):
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([offset, offset + 1])
+        stream.unacked = 0
+        stream.last_ack = time.monotonic()
+        self.send({'type': 'ack', 'topic': topic, 'ack': stream.expected, 'sacks': ranges,
+                   'window': self.window - len(stream.buffer)})
+
+    def nack(self, topic, stream, now):
+        """Ask for the holes below the highest buffered offset that were not asked for recently."""
+        missing = []
+        for offset in range(stream.expected, max(stream.buffer)):
+            if offset not in stream.buffer and now - stream.nacked.get(offset, 0.0) >= NACK_INTERVAL:
+                missing.append(offset)
+                stream.nacked[offset] = now
+                if len(missing) == MAX_NACK:
+                    break
+        for offset in [offset for offset in stream.nacked if offset < stream.expected]:
+            del stream.nacked[offset]
+        if missing:
+            self.send({'type': 'nack', 'topic': topic, 'missing': missing})
+
+    def stats(self):
+        with self.lock:
+            return {'topics': len(self.streams), 'buffered': sum(len(s.buffer) for s in self.streams.values()),
+                    'duplicates': self.duplicates, 'lost': self.lost}
+
+    def run(self):
+        while True:
+            time.sleep(ACK_INTERVAL / 2)
+            now = time.monotonic()
+            try:
+                with self.lock:
+                    for topic, stream in self.streams.items():
+                        if stream.expected is None:
+                            if now - stream.requested >= SUBSCRIBE_RETRY:
+                                self.send(stream.request)
+                                stream.requested = now
+                            continue
+                        if stream.buffer:
+                            self.nack(topic, stream, now)
+                        if (stream.unacked or stream.buffer) and now - stream.last_ack >= ACK_INTERVAL:
+                            self.ack(topic, stream)
+            except OSError as e:
+                print(f"Error acknowledging reliable topics: {e}")
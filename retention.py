@@ -0,0 +1,237 @@
+import array
+import collections
+import threading
+import time
+
+DEFAULT_RETENTION_MESSAGES = 1024  # Messages kept per topic
+DEFAULT_RETENTION_BYTES = 1024 * 1024  # Encoded bytes kept per topic
+DEFAULT_RETENTION_TOTAL_BYTES = 256 * 1024 * 1024  # Memory held by all topics' buffers together
+INITIAL_SLOTS = 8  # Starting number of message slots of a topic; doubled up to the message limit
+BUFFER_OVERHEAD = 400  # Approximate bytes of a topic's buffer objects and store entry, counted against the total
+DEFAULT_REPLAY_BATCH = 64  # Messages sent to a catching-up subscriber per turn
+DEFAULT_REPLAY_INTERVAL = 0.01  # Seconds between turns, so catch-up cannot swamp live traffic
+
+
+class RingBuffer:
+    """Bounded log of one topic's encoded messages, addressed by increasing offsets.
+
+    Message bytes live back to back in one circular bytearray and their
+    positions in two arrays of slots, so retaining a message allocates no
+    Python objects. The bytearray and the slot arrays start small and double
+    (up to max_bytes and max_messages) so quiet topics stay cheap; once at the
+    limit, appending evicts the oldest messages until the new one fits under
+    both the message and the byte limit.
+    """
+
+    __slots__ = ('max_messages', 'max_bytes', 'data', 'capacity', 'starts', 'lengths', 'first', 'next', 'head', 'size')
+
+    def __init__(self, max_messages=DEFAULT_RETENTION_MESSAGES, max_bytes=DEFAULT_RETENTION_BYTES, first=0):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.data = bytearray()
+        self.capacity = min(max_messages, INITIAL_SLOTS)  # Slots; a message's slot is its offset modulo this
+        self.starts = array.array('Q', bytes(8 * self.capacity))  # Slot -> position of the message in data
+        self.lengths = array.array('I', bytes(4 * self.capacity))  # Slot -> length of the message
+        self.first = first  # Offset of the oldest retained message
+        self.next = first  # Offset the next appended message will get
+        self.head = 0  # Position in data where the next message is written
+        self.size = 0  # Bytes held by retained messages
+
+    def __len__(self):
+        return self.next - self.first
+
+    def append(self, payload):
+        """Store payload and return its offset; a payload over max_bytes gets an offset but is not kept."""
+        offset = self.next
+        self.next += 1
+        length = len(payload)
+        if length > self.max_bytes:
+            self.first = self.next
+            self.size = 0
+            return offset
+        if len(self) > self.capacity and self.capacity < self.max_messages:
+            self.grow_slots(min(self.max_messages, 2 * self.capacity))
+        while len(self) > 1 and not self.fits(length):
+            if len(self.data) < self.max_bytes and len(self) <= self.max_messages:
+                self.grow(min(self.max_bytes, max(2 * len(self.data), self.size + length)))
+            else:
+                self.evict()
+        if length > len(self.data):
+            self.grow(min(self.max_bytes, max(2 * len(self.data), length)))
+        if len(self) == 1:
+            self.head = 0  # Only the new message: start again at the front
+        elif len(self.data) - self.head < length:
+            self.head = 0  # Not enough room before the end: wrap around
+        slot = offset % self.capacity
+        self.data[self.head:self.head + length] = payload
+        self.starts[slot] = self.head
+        self.lengths[slot] = length
+        self.head += length
+        self.size += length
+        return offset
+
+    def fits(self, length):
+        """Whether length bytes can be written without touching a retained message (excluding the newest slot)."""
+        if len(self) > self.capacity:
+            return False
+        tail = self.starts[self.first % self.capacity]
+        if self.head > tail:  # Retained bytes are [tail, head): room at the end or before tail
+            return len(self.data) - self.head >= length or tail >= length
+        return tail - self.head >= length  # Wrapped: room is the gap [head, tail)
+
+    def grow(self, capacity):
+        """Move the retained messages, oldest first, to the front of a larger bytearray."""
+        data = bytearray(capacity)
+        position = 0
+        for offset in range(self.first, self.next - 1):  # The newest offset is not stored yet
+            slot = offset % self.capacity
+            start, length = self.starts[slot], self.lengths[slot]
+            data[position:position + length] = self.data[start:start + length]
+            self.starts[slot] = position
+            position += length
+        self.data = data
+        self.head = position
+
+    def grow_slots(self, capacity):
+        """Move the retained messages' positions to larger slot arrays."""
+        starts = array.array('Q', bytes(8 * capacity))
+        lengths = array.array('I', bytes(4 * capacity))
+        for offset in range(self.first, self.next - 1):
+            starts[offset % capacity] = self.starts[offset % self.capacity]
+            lengths[offset % capacity] = self.lengths[offset % self.capacity]
+        self.starts, self.lengths, self.capacity = starts, lengths, capacity
+
+    def evict(self):
+        self.size -= self.lengths[self.first % self.capacity]
+        self.first += 1
+
+    def footprint(self):
+        """Bytes allocated for this topic's messages and slots."""
+        return BUFFER_OVERHEAD + len(self.data) + 12 * self.capacity
+
+    def read(self, start, end):
+        """Return [(offset, bytes)] for the retained messages with start <= offset < end."""
+        messages = []
+        for offset in range(max(start, self.first), min(end, self.next)):
+            slot = offset % self.capacity
+            position = self.starts[slot]
+            messages.append((offset, bytes(self.data[position:position + self.lengths[slot]])))
+        return messages
+
+
+class RetentionStore:
+    """Per-topic ring buffers, created on a topic's first message and safe to use across threads.
+
+    The memory held by all buffers together is capped at total_bytes: past it,
+    the buffers of the topics published least recently are dropped whole. A
+    dropped topic keeps only its next offset, so its offsets carry on if it is
+    published again.
+    """
+
+    def __init__(self, max_messages=DEFAULT_RETENTION_MESSAGES, max_bytes=DEFAULT_RETENTION_BYTES,
+                 total_bytes=DEFAULT_RETENTION_TOTAL_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.total_bytes = total_bytes
+        self.buffers = collections.OrderedDict()  # {topic: RingBuffer}, least recently published first
+        self.retired = {}  # {topic: next offset} of topics whose buffer was dropped
+        self.allocated = 0  # Sum of the buffers' footprints
+        self.dropped = 0  # Buffers dropped to stay under total_bytes
+        self.lock = threading.Lock()
+
+    def next_offset(self, topic):
+        """Offset the next message published on topic will get."""
+        with self.lock:
+            buffer = self.buffers.get(topic)
+            return buffer.next if buffer else self.retired.get(topic, 0)
+
+    def append(self, topic, payload):
+        with self.lock:
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                buffer = self.buffers[topic] = RingBuffer(self.max_messages, self.max_bytes,
+                                                          self.retired.pop(topic, 0))
+                footprint = 0
+            else:
+                self.buffers.move_to_end(topic)
+                footprint = buffer.footprint()
+            offset = buffer.append(payload)
+            self.allocated += buffer.footprint() - footprint
+            while self.allocated > self.total_bytes and len(self.buffers) > 1:
+                idle_topic, idle = self.buffers.popitem(last=False)
+                self.retired[idle_topic] = idle.next
+                self.allocated -= idle.footprint()
+                self.dropped += 1
+            return offset
+
+    def read(self, topic, start, end):
+        with self.lock:
+            buffer = self.buffers.get(topic)
+            return buffer.read(start, end) if buffer else []
+
+    def bounds(self, topic):
+        """Return (first retained offset, next offset) for topic."""
+        with self.lock:
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                offset = self.retired.get(topic, 0)
+                return offset, offset
+            return buffer.first, buffer.next
+
+    def stats(self):
+        with self.lock:
+            return {'topics': len(self.buffers), 'messages': sum(len(buffer) for buffer in self.buffers.values()),
+                    'bytes': sum(buffer.size for buffer in self.buffers.values()), 'allocated': self.allocated,
+                    'dropped_topics': self.dropped}
+
+
+class ReplayScheduler:
+    """Streams retained messages to catching-up subscribers in paced batches.
+
+    A single thread serves every catch-up in turn, sending at most batch_size
+    messages per subscriber per interval, so many late subscribers share a
+    fixed budget instead of each getting a thread and a burst.
+    """
+
+    def __init__(self, store, send, batch_size=DEFAULT_REPLAY_BATCH, interval=DEFAULT_REPLAY_INTERVAL):
+        self.store = store
+        self.send = send  # Called as send(payloads, addr, wire_format) with a list of stored payloads
+        self.batch_size = batch_size
+        self.interval = interval
+        self.jobs = collections.deque()  # [topic, next offset, end offset, addr, wire_format]
+        self.cond = threading.Condition()
+        self.replayed = 0  # Messages sent by catch-ups
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def replay(self, topic, start, end, addr, wire_format):
+        """Queue messages start <= offset < end of topic for delivery to addr."""
+        if start < end:
+            with self.cond:
+                self.jobs.append([topic, start, end, addr, wire_format])
+                self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.jobs:
+                    self.cond.wait()
+                jobs = len(self.jobs)
+            for _ in range(jobs):
+                with self.cond:
+                    job = self.jobs.popleft()
+                topic, start, end, addr, wire_format = job
+                batch = self.store.read(topic, start, min(end, start + self.batch_size))
+                if batch:
+                    try:
+                        self.send([payload for _, payload in batch], addr, wire_format)
+                        self.replayed += len(batch)
+                    except OSError as e:
+                        print(f"Error replaying topic '{topic}' to {addr}: {e}")
+                        continue
+                    job[1] = batch[-1][0] + 1
+                else:
+                    job[1] = min(end, max(start + self.batch_size, self.store.bounds(topic)[0]))  # Skip evicted
+                if job[1] < end:
+                    with self.cond:
+                        self.jobs.append(job)
+            time.sleep(self.interval)
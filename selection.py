@@ -0,0 +1,88 @@
+import abc
+import heapq
+import random
+import time
+
+ROTATED_TOPICS = 65536  # Topics whose round-robin position is remembered before all positions are reset
+REPORT_MAX_AGE = 15.0  # Seconds a load report is trusted: peers report every 5 s, so three reports were missed
+
+
+class SelectionPolicy(abc.ABC):
+    """Decides which of the peers holding a topic should serve a query."""
+
+    @abc.abstractmethod
+    def rank(self, topic, holders, loads, count=1):
+        """Return up to count peer ids from holders, best candidate first.
+
+        holders is the list of peers holding the topic in the order they added it;
+        loads maps peer_id to the last {'load', 'subscribers', 'reported_at'} report
+        of that peer, reported_at being a time.monotonic() timestamp.
+        """
+
+
+class FirstPolicy(SelectionPolicy):
+    """Always prefer the earliest peer that added the topic."""
+
+    def rank(self, topic, holders, loads, count=1):
+        return holders[:count]
+
+
+class RoundRobinPolicy(SelectionPolicy):
+    """Rotate the starting peer on every query of a topic, independently per topic."""
+
+    def __init__(self):
+        self.positions = {}  # {topic: number of queries of it so far}
+
+    def rank(self, topic, holders, loads, count=1):
+        position = self.positions.get(topic, 0)
+        if position == 0 and len(self.positions) >= ROTATED_TOPICS:
+            self.positions.clear()  # Forget deleted and rarely queried topics; rotations just restart
+        self.positions[topic] = position + 1
+        start = position % len(holders)
+        rotated = holders[start:] + holders[:start]
+        return rotated[:count]
+
+
+class RandomPolicy(SelectionPolicy):
+    """Pick peers uniformly at random."""
+
+    def rank(self, topic, holders, loads, count=1):
+        return random.sample(holders, min(count, len(holders)))
+
+
+class LeastReportedPolicy(SelectionPolicy):
+    """Prefer the peers with the smallest value of one field of their latest load report."""
+
+    field = None
+
+    def rank(self, topic, holders, loads, count=1):
+        now = time.monotonic()
+
+        def key(peer_id):
+            report = loads.get(peer_id)
+            # A peer whose report is too old counts as unreported rather than as still that busy
+            return report[self.field] if report and now - report['reported_at'] <= REPORT_MAX_AGE else 0
+        if count == 1:
+            return [min(holders, key=key)]
+        return heapq.nsmallest(count, holders, key=key)
+
+
+class LeastSubscribersPolicy(LeastReportedPolicy):
+    """Prefer the peer currently serving the fewest subscribers."""
+
+    field = 'subscribers'
+
+
+class LeastLoadPolicy(LeastReportedPolicy):
+    """Prefer the peer that most recently reported the lowest message rate."""
+
+    field = 'load'
+
+
+POLICIES = {
+    'first': FirstPolicy,
+    'round_robin': RoundRobinPolicy,
+    'random': RandomPolicy,
+    'least_subscribers': LeastSubscribersPolicy,
+    'least_load': LeastLoadPolicy,
+}
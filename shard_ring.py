@@ -0,0 +1,118 @@
+import bisect
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from codec import JSON
+from connection_pool import DEFAULT_POOL_SIZE, get_pool
+from topic_trie import is_pattern
+
+DEFAULT_VIRTUAL_NODES = 128  # Ring positions per shard; more positions even out the key ranges
+
+# Actions routed by the hash of their 'topic'; batch actions are split by the hash of each topic
+TOPIC_ACTIONS = {'add_topic', 'delete_topic', 'query_topic', 'add_interest', 'remove_interest', 'query_interest'}
+BATCH_ACTIONS = {'register_topics', 'delete_topics', 'query_topics'}
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding or removing a node only moves about 1/N of the keys."""
+
+    def __init__(self, nodes, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node_for(self, key):
+        """Return the node owning key: the first ring position at or after its hash."""
+        index = bisect.bisect_left(self.hashes, ring_hash(key))
+        return self.owners[index % len(self.owners)]
+
+
+class ShardRouter:
+    """Sends indexing requests to a set of IndexingServer shards.
+
+    Topic actions go to the shard owning the topic, batch actions are split by
+    owner and their per-item results reassembled in order, and peer-wide actions
+    (register, unregister, report_load, get_peers, stats) are sent to every
+    shard with the responses gathered into one; stats keeps one entry per shard.
+    Wildcard patterns span shards: pattern and prefix queries are asked of every
+    shard and their topics merged, and pattern interests are kept on every shard.
+    Offers the same request() call as a ConnectionPool so callers can use either.
+    """
+
+    def __init__(self, shards, pool_size=DEFAULT_POOL_SIZE, wire_format=JSON, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        self.shards = [tuple(shard) for shard in shards]
+        self.ring = ConsistentHashRing(range(len(self.shards)), virtual_nodes)
+        self.pools = [get_pool(shard, pool_size, wire_format) for shard in self.shards]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards))
+
+    def shard_for(self, topic):
+        """Return the address of the shard owning topic."""
+        return self.shards[self.ring.node_for(topic)]
+
+    def request(self, message):
+        action = message.get('action')
+        if action in TOPIC_ACTIONS:
+            if action != 'query_interest' and (message.get('prefix') or is_pattern(message['topic'])):
+                responses = self.scatter(message)
+                return self.gather_matching(responses) if action == 'query_topic' else self.gather_status(responses)
+            return self.pools[self.ring.node_for(message['topic'])].request(message)
+        if action in BATCH_ACTIONS:
+            return self.request_batch(message)
+        responses = self.scatter(message)
+        if action == 'get_peers':
+            return self.gather_peers(responses)
+        if action == 'stats':
+            return {'status': 'success', 'shards': [response.get('stats') for response in responses]}
+        return self.gather_status(responses)
+
+    def scatter(self, message):
+        """Send message to every shard concurrently and return the responses in shard order."""
+        return list(self.executor.map(lambda pool: pool.request(message), self.pools))
+
+    def request_batch(self, message):
+        topics = message['topics']
+        positions = {}  # {shard index: [positions in topics]}
+        for position, topic in enumerate(topics):
+            positions.setdefault(self.ring.node_for(topic), []).append(position)
+
+        def send(shard):
+            sub_message = dict(message, topics=[topics[p] for p in positions[shard]])
+            return shard, self.pools[shard].request(sub_message)
+
+        results = [None] * len(topics)
+        for shard, response in self.executor.map(send, list(positions)):
+            if response['status'] != 'success':
+                return response
+            for position, result in zip(positions[shard], response['results']):
+                results[position] = result
+        return {'status': 'success', 'results': results}
+
+    def gather_peers(self, responses):
+        peers = {}
+        for response in responses:
+            if response['status'] == 'success':
+                peers.update(response['peers'])
+        if peers:
+            return {'status': 'success', 'peers': peers}
+        return {'status': 'error', 'message': 'No peers registered'}
+
+    def gather_matching(self, responses):
+        """Combine the answers to a pattern query: the first error, else every shard's matching topics."""
+        topics = []
+        for response in responses:
+            if response['status'] != 'success':
+                return response
+            topics.extend(response['topics'])
+        return dict(responses[0], topics=topics)
+
+    def gather_status(self, responses):
+        """Combine the responses to a broadcast action: the first error, else the first success."""
+        for response in responses:
+            if response['status'] != 'success':
+                return response
+        return responses[0]
@@ -0,0 +1,80 @@
+from topic_trie import TopicTrie
+
+
+class TopicIndex:
+    """Two-way index between topics and the peers holding them.
+
+    Every operation touches only the entries involved: topic membership is kept
+    in insertion-ordered dicts (used as ordered sets) and each peer keeps the set
+    of its own topics, so removing a peer costs O(topics of that peer) regardless
+    of how many topics exist in total. A trie over the same entries answers
+    wildcard and prefix lookups in time set by the topic depth.
+    """
+
+    def __init__(self):
+        self.topics = {}  # {topic: {peer_id: None}} in the order peers added the topic
+        self.peer_topics = {}  # {peer_id: {topic1, topic2}}
+        self.trie = TopicTrie()  # The same {topic: holders} entries, by topic level
+
+    def __len__(self):
+        return len(self.topics)
+
+    def __contains__(self, topic):
+        return topic in self.topics
+
+    def add(self, peer_id, topic):
+        """Record that peer_id holds topic; returns False if it already did."""
+        holders = self.topics.get(topic)
+        if holders is None:
+            holders = self.topics[topic] = self.trie.setdefault(topic, {})
+        elif peer_id in holders:
+            return False
+        holders[peer_id] = None
+        self.peer_topics.setdefault(peer_id, set()).add(topic)
+        return True
+
+    def remove(self, peer_id, topic):
+        """Drop peer_id from topic; returns False if it was not holding it."""
+        holders = self.topics.get(topic)
+        if holders is None or peer_id not in holders:
+            return False
+        del holders[peer_id]
+        if not holders:
+            del self.topics[topic]  # Remove topic if no peers hold it
+            self.trie.pop(topic)
+        owned = self.peer_topics[peer_id]
+        owned.discard(topic)
+        if not owned:
+            del self.peer_topics[peer_id]
+        return True
+
+    def remove_peer(self, peer_id):
+        """Drop every topic held by peer_id and return the affected topics."""
+        owned = self.peer_topics.pop(peer_id, ())
+        for topic in owned:
+            holders = self.topics[topic]
+            del holders[peer_id]
+            if not holders:
+                del self.topics[topic]
+                self.trie.pop(topic)
+        return owned
+
+    def holders(self, topic):
+        """Return the peers holding topic, in the order they added it."""
+        holders = self.topics.get(topic)
+        return list(holders) if holders else []
+
+    def matching_topics(self, pattern):
+        """Return the topics matching a wildcard pattern, with their holders, as [(topic, [peer_id])]."""
+        return [(topic, list(holders)) for topic, holders in self.trie.expand(pattern)]
+
+    def matching_holders(self, topic):
+        """Return the peers holding topic itself or a wildcard pattern matching it, without duplicates."""
+        holders = {}
+        for _, peers in self.trie.match(topic):
+            holders.update(peers)
+        return list(holders)
+
+    def topics_of(self, peer_id):
+        """Return the set of topics held by peer_id."""
+        return self.peer_topics.get(peer_id, set())
@@ -0,0 +1,160 @@
+LEVEL_SEPARATOR = '/'  # Topics are hierarchical: 'sensors/eu/paris'
+SINGLE_LEVEL = '*'  # Wildcard level matching exactly one level
+MULTI_LEVEL = '#'  # Wildcard level matching any number of remaining levels, including none; last level only
+
+
+def is_pattern(topic):
+    """Whether topic contains a wildcard level."""
+    return any(level in (SINGLE_LEVEL, MULTI_LEVEL) for level in topic.split(LEVEL_SEPARATOR))
+
+
+def validate_pattern(pattern):
+    """Raise ValueError unless pattern is a topic or a well-formed wildcard pattern."""
+    levels = pattern.split(LEVEL_SEPARATOR)
+    for position, level in enumerate(levels):
+        if level != MULTI_LEVEL and MULTI_LEVEL in level or level != SINGLE_LEVEL and SINGLE_LEVEL in level:
+            raise ValueError(f"Wildcards must fill a whole level: '{pattern}'")
+        if level == MULTI_LEVEL and position != len(levels) - 1:
+            raise ValueError(f"'{MULTI_LEVEL}' may only be the last level: '{pattern}'")
+
+
+def prefix_pattern(prefix):
+    """Pattern matching prefix itself and every topic below it."""
+    prefix = prefix.rstrip(LEVEL_SEPARATOR)
+    return f"{prefix}{LEVEL_SEPARATOR}{MULTI_LEVEL}" if prefix else MULTI_LEVEL
+
+
+def topic_matches(pattern, topic):
+    """Whether topic matches pattern, comparing the two directly."""
+    levels = topic.split(LEVEL_SEPARATOR)
+    for position, level in enumerate(pattern.split(LEVEL_SEPARATOR)):
+        if level == MULTI_LEVEL:
+            return True
+        if position == len(levels) or level not in (SINGLE_LEVEL, levels[position]):
+            return False
+    return len(levels) == len(pattern.split(LEVEL_SEPARATOR))
+
+
+class TrieNode:
+    __slots__ = ('children', 'key', 'value')
+
+    def __init__(self):
+        self.children = {}  # {level: TrieNode}
+        self.key = None  # Full topic or pattern stored at this node, None if none ends here
+        self.value = None
+
+
+class TopicTrie:
+    """Maps topics or wildcard patterns to values, one trie level per topic level.
+
+    match() finds the stored patterns matching a topic and expand() the stored
+    topics matching a pattern; both walk only the branches the query can reach,
+    so their cost follows the depth of the topic (and the size of the answer),
+    not the number of entries stored.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        node = self.find(key)
+        return node is not None and node.key is not None
+
+    def find(self, key):
+        node = self.root
+        for level in key.split(LEVEL_SEPARATOR):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+    def get(self, key, default=None):
+        node = self.find(key)
+        return node.value if node is not None and node.key is not None else default
+
+    def setdefault(self, key, value):
+        """Return the value stored for key, storing value first if there is none."""
+        node = self.root
+        for level in key.split(LEVEL_SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TrieNode()
+            node = child
+        if node.key is None:
+            node.key = key
+            node.value = value
+            self.size += 1
+        return node.value
+
+    def pop(self, key, default=None):
+        """Remove key and return its value, pruning the branches left empty."""
+        path = [self.root]
+        levels = key.split(LEVEL_SEPARATOR)
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                return default
+            path.append(node)
+        node = path[-1]
+        if node.key is None:
+            return default
+        value = node.value
+        node.key = node.value = None
+        self.size -= 1
+        for level, parent, child in zip(reversed(levels), reversed(path[:-1]), reversed(path)):
+            if child.children or child.key is not None:
+                break
+            del parent.children[level]
+        return value
+
+    def items(self):
+        """Yield every (key, value) stored."""
+        yield from self.below(self.root)
+
+    def below(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.key is not None:
+                yield node.key, node.value
+            stack.extend(node.children.values())
+
+    def match(self, topic):
+        """Yield (pattern, value) for every stored pattern (or topic) matching topic."""
+        levels = topic.split(LEVEL_SEPARATOR)
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            rest = node.children.get(MULTI_LEVEL)
+            if rest is not None and rest.key is not None:
+                yield rest.key, rest.value  # Matches the remaining levels, however many
+            if depth == len(levels):
+                if node.key is not None:
+                    yield node.key, node.value
+                continue
+            for level in (levels[depth], SINGLE_LEVEL):
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, depth + 1))
+
+    def expand(self, pattern):
+        """Yield (topic, value) for every stored topic matching pattern."""
+        levels = pattern.split(LEVEL_SEPARATOR)
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(levels):
+                if node.key is not None:
+                    yield node.key, node.value
+            elif levels[depth] == MULTI_LEVEL:
+                yield from self.below(node)
+            elif levels[depth] == SINGLE_LEVEL:
+                stack.extend((child, depth + 1) for child in node.children.values())
+            else:
+                child = node.children.get(levels[depth])
+                if child is not None:
+                    stack.append((child, depth + 1))